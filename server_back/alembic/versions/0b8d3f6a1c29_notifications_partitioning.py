@@ -0,0 +1,112 @@
+"""notifications partitioning
+
+Revision ID: 0b8d3f6a1c29
+Revises: e7a2c5f90b13
+Create Date: 2026-10-18 16:12:48.330571
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from core.models.ddl import NOTIFICATIONS_CREATE_PARTITIONS_FUNCTION, NOTIFICATIONS_DEFAULT_PARTITION, \
+    NOTIFICATION_COUNTER_TRIGGERS, statement_trigger
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b8d3f6a1c29'
+down_revision: Union[str, None] = 'e7a2c5f90b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_notifications_user_read_created', 'user_id, is_read, created_at'),
+    ('ix_notifications_user_created_id', 'user_id, created_at, id'),
+    ('ix_notifications_file_id', 'file_id'),
+]
+
+
+def _create_counter_triggers() -> None:
+    for trigger in NOTIFICATION_COUNTER_TRIGGERS:
+        op.execute(statement_trigger(*trigger, "notification_counters_apply"))
+
+
+def _create_indexes() -> None:
+    for name, columns in INDEXES:
+        op.execute(f"CREATE INDEX {name} ON notifications ({columns})")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблица пересоздаётся как секционированная и заполняется копией; запись в notifications
+    # заблокирована до конца миграции
+    op.execute("LOCK TABLE notifications IN EXCLUSIVE MODE")
+    op.execute("ALTER TABLE notifications RENAME TO notifications_old")
+    op.execute("ALTER TABLE notifications_old RENAME CONSTRAINT notifications_pkey TO notifications_old_pkey")
+    for name, _ in INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_old")
+    op.execute("ALTER SEQUENCE notifications_id_seq OWNED BY NONE")
+
+    op.execute("""
+        CREATE TABLE notifications (
+            id integer NOT NULL DEFAULT nextval('notifications_id_seq'),
+            file_id integer NOT NULL REFERENCES documents (id) ON DELETE CASCADE,
+            user_id integer NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            message varchar NOT NULL,
+            created_at timestamp without time zone NOT NULL,
+            is_read boolean NOT NULL,
+            CONSTRAINT notifications_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE notifications_id_seq OWNED BY notifications.id")
+    op.execute(NOTIFICATIONS_CREATE_PARTITIONS_FUNCTION)
+    op.execute(NOTIFICATIONS_DEFAULT_PARTITION)
+    op.execute("""
+        SELECT notifications_create_partitions(
+            coalesce((SELECT min(created_at) FROM notifications_old), now())::date,
+            (date_trunc('month', now()) + interval '2 months')::date
+        )
+    """)
+
+    # Копия до создания индексов и триггеров: счётчики уже посчитаны по тем же строкам
+    op.execute("""
+        INSERT INTO notifications (id, file_id, user_id, message, created_at, is_read)
+        SELECT id, file_id, user_id, message, coalesce(created_at, now()), coalesce(is_read, false)
+        FROM notifications_old
+    """)
+    op.execute("DROP TABLE notifications_old")
+    _create_indexes()
+    _create_counter_triggers()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("LOCK TABLE notifications IN EXCLUSIVE MODE")
+    op.execute("ALTER TABLE notifications RENAME TO notifications_partitioned")
+    op.execute("ALTER TABLE notifications_partitioned RENAME CONSTRAINT notifications_pkey "
+               "TO notifications_partitioned_pkey")
+    for name, _ in INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_partitioned")
+    op.execute("ALTER SEQUENCE notifications_id_seq OWNED BY NONE")
+
+    op.execute("""
+        CREATE TABLE notifications (
+            id integer NOT NULL DEFAULT nextval('notifications_id_seq'),
+            file_id integer NOT NULL REFERENCES documents (id) ON DELETE CASCADE,
+            user_id integer NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            message varchar NOT NULL,
+            created_at timestamp without time zone NOT NULL,
+            is_read boolean NOT NULL,
+            CONSTRAINT notifications_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("ALTER SEQUENCE notifications_id_seq OWNED BY notifications.id")
+    op.execute("""
+        INSERT INTO notifications (id, file_id, user_id, message, created_at, is_read)
+        SELECT id, file_id, user_id, message, created_at, is_read FROM notifications_partitioned
+    """)
+    op.execute("DROP TABLE notifications_partitioned CASCADE")
+    op.execute("DROP FUNCTION IF EXISTS notifications_create_partitions(date, date)")
+    op.execute("CREATE INDEX ix_notifications_user_read_created ON notifications (user_id, is_read, created_at)")
+    op.execute("CREATE INDEX ix_notifications_user_created_id ON notifications (user_id, created_at, id)")
+    _create_counter_triggers()
@@ -0,0 +1,41 @@
+"""blobs
+
+Revision ID: 3828dfa0f286
+Revises: 7bc6ad91095d
+Create Date: 2026-10-18 11:02:47.530918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3828dfa0f286'
+down_revision: Union[str, None] = '7bc6ad91095d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('blobs',
+    sa.Column('digest', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('path', sa.String(), nullable=False),
+    sa.Column('refcount', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('digest')
+    )
+    op.add_column('documents', sa.Column('blob_digest', sa.String(length=64), nullable=True))
+    op.create_foreign_key('documents_blob_digest_fkey', 'documents', 'blobs', ['blob_digest'], ['digest'])
+    op.create_index(op.f('ix_documents_blob_digest'), 'documents', ['blob_digest'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_documents_blob_digest'), table_name='documents')
+    op.drop_constraint('documents_blob_digest_fkey', 'documents', type_='foreignkey')
+    op.drop_column('documents', 'blob_digest')
+    op.drop_table('blobs')
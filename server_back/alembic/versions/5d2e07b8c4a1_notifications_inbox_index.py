@@ -0,0 +1,31 @@
+"""notifications inbox index
+
+Revision ID: 5d2e07b8c4a1
+Revises: f16bc1c47916
+Create Date: 2026-10-18 13:40:12.208416
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2e07b8c4a1'
+down_revision: Union[str, None] = 'f16bc1c47916'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_notifications_user_read_created', 'notifications', ['user_id', 'is_read', 'created_at'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_notifications_user_read_created', table_name='notifications',
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,42 @@
+"""documents listing indexes
+
+Revision ID: 740c9daa0b74
+Revises: 3828dfa0f286
+Create Date: 2026-10-18 12:21:05.817344
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '740c9daa0b74'
+down_revision: Union[str, None] = '3828dfa0f286'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_documents_uploaded_at_id', ['uploaded_at', 'id']),
+    ('ix_documents_doc_type_uploaded_at', ['doc_type_id', 'uploaded_at', 'id']),
+    ('ix_documents_responsible_uploaded_at', ['responsible_id', 'uploaded_at', 'id']),
+    ('ix_documents_permanent_uploaded_at', ['permanent', 'uploaded_at', 'id']),
+    ('ix_documents_uploaded_by_uploaded_at', ['uploaded_by', 'uploaded_at', 'id']),
+    ('ix_documents_valid_until', ['valid_until']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY нельзя выполнять в транзакции; таблица не блокируется на запись
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(name, 'documents', columns, unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, _ in INDEXES:
+            op.drop_index(name, table_name='documents', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,57 @@
+"""notification inbox
+
+Revision ID: 9c3e7b2a5d41
+Revises: d8a4f0b6c317
+Create Date: 2026-10-18 21:12:08.514237
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from core.models.ddl import NOTIFICATION_INBOX_FUNCTION, NOTIFICATION_INBOX_TRIGGERS, statement_trigger
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e7b2a5d41'
+down_revision: Union[str, None] = 'd8a4f0b6c317'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('notification_inbox',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('file_id', sa.Integer(), nullable=False),
+    sa.Column('notified_at', sa.DateTime(), nullable=False),
+    sa.Column('unread', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('total', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['file_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'file_id')
+    )
+    op.execute(NOTIFICATION_INBOX_FUNCTION)
+    for trigger in NOTIFICATION_INBOX_TRIGGERS:
+        op.execute(statement_trigger(*trigger, "notification_inbox_apply"))
+    # Триггеры уже блокируют запись в notifications до конца миграции, поэтому заполнение согласовано
+    op.execute("""
+        INSERT INTO notification_inbox (user_id, file_id, notified_at, unread, total)
+        SELECT user_id, file_id, max(created_at), count(*) FILTER (WHERE NOT is_read), count(*)
+        FROM notifications GROUP BY user_id, file_id
+    """)
+    op.create_index('ix_notification_inbox_user_notified', 'notification_inbox',
+                    ['user_id', 'notified_at', 'file_id'], unique=False)
+    op.create_index('ix_notification_inbox_user_unread_notified', 'notification_inbox',
+                    ['user_id', 'notified_at', 'file_id'], unique=False, postgresql_where=sa.text('unread > 0'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, _, _ in NOTIFICATION_INBOX_TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON notifications")
+    op.execute("DROP FUNCTION IF EXISTS notification_inbox_apply()")
+    op.drop_index('ix_notification_inbox_user_unread_notified', table_name='notification_inbox')
+    op.drop_index('ix_notification_inbox_user_notified', table_name='notification_inbox')
+    op.drop_table('notification_inbox')
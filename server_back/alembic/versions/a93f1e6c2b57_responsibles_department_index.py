@@ -0,0 +1,31 @@
+"""responsibles department index
+
+Revision ID: a93f1e6c2b57
+Revises: 5d2e07b8c4a1
+Create Date: 2026-10-18 14:25:40.117093
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a93f1e6c2b57'
+down_revision: Union[str, None] = '5d2e07b8c4a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_responsibles_department_id'), 'responsibles', ['department_id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_responsibles_department_id'), table_name='responsibles',
+                      postgresql_concurrently=True, if_exists=True)
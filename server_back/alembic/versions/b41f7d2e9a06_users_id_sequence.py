@@ -0,0 +1,30 @@
+"""users id sequence
+
+Revision ID: b41f7d2e9a06
+Revises: 0b8d3f6a1c29
+Create Date: 2026-10-18 16:05:12.402311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41f7d2e9a06'
+down_revision: Union[str, None] = '0b8d3f6a1c29'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Регистрация задавала id вручную как max(id) + 1, и последовательность отстала от таблицы
+    op.execute(
+        "SELECT setval(pg_get_serial_sequence('users', 'id'), COALESCE((SELECT max(id) FROM users), 0) + 1, false)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    pass
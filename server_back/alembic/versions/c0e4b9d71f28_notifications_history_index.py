@@ -0,0 +1,31 @@
+"""notifications history index
+
+Revision ID: c0e4b9d71f28
+Revises: a93f1e6c2b57
+Create Date: 2026-10-18 14:58:03.642719
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c0e4b9d71f28'
+down_revision: Union[str, None] = 'a93f1e6c2b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_notifications_user_created_id', 'notifications', ['user_id', 'created_at', 'id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_notifications_user_created_id', table_name='notifications',
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,69 @@
+"""index pack: users department, responsibles by user, partial unread notifications
+
+Revision ID: c7d5e1a3f820
+Revises: b41f7d2e9a06
+Create Date: 2026-10-18 17:40:03.551920
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d5e1a3f820'
+down_revision: Union[str, None] = 'b41f7d2e9a06'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UNREAD_INDEX = 'ix_notifications_user_unread_created'
+
+
+def _notification_partitions() -> list[str]:
+    result = op.get_bind().execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'notifications'::regclass ORDER BY c.relname"
+    ))
+    return list(result.scalars())
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY нельзя выполнять в транзакции; таблицы не блокируются на запись
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_users_department_id'), 'users', ['department_id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_responsibles_user_department', 'responsibles', ['user_id', 'department_id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+        # Секционированную таблицу нельзя индексировать CONCURRENTLY: индекс создаётся только на родителе
+        # (ON ONLY, пока невалидный), затем CONCURRENTLY на каждой секции и присоединяется к родителю.
+        # Секции, созданные позже, получают индекс автоматически
+        op.execute(f'CREATE INDEX IF NOT EXISTS {UNREAD_INDEX} ON ONLY notifications (user_id, created_at) '
+                   f'WHERE NOT is_read')
+        for partition in _notification_partitions():
+            child = f'ix_{partition}_user_unread_created'
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} ON {partition} (user_id, created_at) '
+                       f'WHERE NOT is_read')
+            attached = op.get_bind().execute(sa.text(
+                "SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:child)"
+            ), {"child": child}).scalar()
+            if not attached:
+                op.execute(f'ALTER INDEX {UNREAD_INDEX} ATTACH PARTITION {child}')
+
+        # Непрочитанные теперь покрывает частичный индекс, входящие по свежести — ix_notifications_user_created_id.
+        # Индекс секционированной таблицы удаляется только без CONCURRENTLY; это изменение каталога, без перестроения
+        op.drop_index('ix_notifications_user_read_created', table_name='notifications', if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_notifications_user_read_created', 'notifications', ['user_id', 'is_read', 'created_at'],
+                        unique=False, if_not_exists=True)
+        op.drop_index(UNREAD_INDEX, table_name='notifications', if_exists=True)
+        op.drop_index('ix_responsibles_user_department', table_name='responsibles',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_users_department_id'), table_name='users',
+                      postgresql_concurrently=True, if_exists=True)
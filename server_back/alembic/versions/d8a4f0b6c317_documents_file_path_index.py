@@ -0,0 +1,32 @@
+"""documents.file_path index for orphan file collection
+
+Revision ID: d8a4f0b6c317
+Revises: c7d5e1a3f820
+Create Date: 2026-10-18 19:05:41.217406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8a4f0b6c317'
+down_revision: Union[str, None] = 'c7d5e1a3f820'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Сборка мусора проверяет пачки путей через file_path = ANY(...): без индекса каждая пачка читала бы всю таблицу
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_documents_file_path'), 'documents', ['file_path'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_documents_file_path'), table_name='documents',
+                      postgresql_concurrently=True, if_exists=True)
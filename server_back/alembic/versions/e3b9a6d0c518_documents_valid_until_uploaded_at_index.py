@@ -0,0 +1,37 @@
+"""documents (valid_until, uploaded_at, id) index
+
+Revision ID: e3b9a6d0c518
+Revises: 9c3e7b2a5d41
+Create Date: 2026-10-18 23:40:17.305128
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b9a6d0c518'
+down_revision: Union[str, None] = '9c3e7b2a5d41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Как у остальных фильтров /api/file/all: (поле, uploaded_at, id). Новый индекс строится до удаления старого,
+    # чтобы фильтр по valid_until ни в какой момент не остался без индекса
+    with op.get_context().autocommit_block():
+        op.create_index('ix_documents_valid_until_uploaded_at', 'documents', ['valid_until', 'uploaded_at', 'id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_documents_valid_until', table_name='documents',
+                      postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_documents_valid_until', 'documents', ['valid_until'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_documents_valid_until_uploaded_at', table_name='documents',
+                      postgresql_concurrently=True, if_exists=True)
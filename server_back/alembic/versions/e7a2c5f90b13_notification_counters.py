@@ -0,0 +1,47 @@
+"""notification counters
+
+Revision ID: e7a2c5f90b13
+Revises: c0e4b9d71f28
+Create Date: 2026-10-18 15:31:26.905512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from core.models.ddl import NOTIFICATION_COUNTERS_FUNCTION, NOTIFICATION_COUNTER_TRIGGERS, statement_trigger
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a2c5f90b13'
+down_revision: Union[str, None] = 'c0e4b9d71f28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('notification_counters',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('unread', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.execute(NOTIFICATION_COUNTERS_FUNCTION)
+    for trigger in NOTIFICATION_COUNTER_TRIGGERS:
+        op.execute(statement_trigger(*trigger, "notification_counters_apply"))
+    # Триггеры уже блокируют запись в notifications до конца миграции, поэтому заполнение согласовано
+    op.execute("""
+        INSERT INTO notification_counters (user_id, unread)
+        SELECT user_id, count(*) FROM notifications WHERE NOT is_read GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET unread = EXCLUDED.unread
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, _, _ in NOTIFICATION_COUNTER_TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON notifications")
+    op.execute("DROP FUNCTION IF EXISTS notification_counters_apply()")
+    op.drop_table('notification_counters')
@@ -0,0 +1,72 @@
+"""documents search
+
+Revision ID: f16bc1c47916
+Revises: 740c9daa0b74
+Create Date: 2026-10-18 13:02:47.551930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from core.models.ddl import TRGM_EXTENSION, SEARCH_VECTOR_FUNCTIONS, SEARCH_VECTOR_TRIGGERS
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f16bc1c47916'
+down_revision: Union[str, None] = '740c9daa0b74'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH = 5000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(TRGM_EXTENSION)
+    op.add_column('documents', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    for statement in SEARCH_VECTOR_FUNCTIONS + SEARCH_VECTOR_TRIGGERS:
+        op.execute(statement)
+
+    # Заполнение существующих строк пачками, чтобы не держать длинные блокировки строк
+    with op.get_context().autocommit_block():
+        op.execute(f"""
+            DO $$
+            DECLARE
+                last_id integer := 0;
+                max_id integer;
+            BEGIN
+                SELECT coalesce(max(id), 0) INTO max_id FROM documents;
+                WHILE last_id < max_id LOOP
+                    UPDATE documents SET original_filename = original_filename
+                    WHERE id > last_id AND id <= last_id + {BACKFILL_BATCH};
+                    last_id := last_id + {BACKFILL_BATCH};
+                    COMMIT;
+                END LOOP;
+            END
+            $$
+        """)
+        op.create_index('ix_documents_search_vector', 'documents', ['search_vector'], unique=False,
+                        postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_documents_original_filename_trgm', 'documents', ['original_filename'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'original_filename': 'gin_trgm_ops'},
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_documents_file_number_trgm', 'documents', ['file_number'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'file_number': 'gin_trgm_ops'},
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in ('ix_documents_file_number_trgm', 'ix_documents_original_filename_trgm',
+                     'ix_documents_search_vector'):
+            op.drop_index(name, table_name='documents', postgresql_concurrently=True, if_exists=True)
+    op.execute("DROP TRIGGER IF EXISTS departments_search_vector_trigger ON departments")
+    op.execute("DROP TRIGGER IF EXISTS doc_types_search_vector_trigger ON doc_types")
+    op.execute("DROP TRIGGER IF EXISTS documents_search_vector_trigger ON documents")
+    op.execute("DROP FUNCTION IF EXISTS documents_search_vector_refresh()")
+    op.execute("DROP FUNCTION IF EXISTS documents_search_vector_update()")
+    op.drop_column('documents', 'search_vector')
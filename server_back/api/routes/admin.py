@@ -1,30 +1,36 @@
+import asyncio
+import csv
+import io
+import json
 import logging
-from pathlib import Path
-from typing import List
+from typing import BinaryIO, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, UploadFile, File, Query, Request
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
-from starlette.responses import PlainTextResponse
+from starlette.responses import PlainTextResponse, StreamingResponse
 
-from core.db import get_async_session
+from core.db import get_async_session, get_read_session, engine, pool_metrics, replica_engine, replica_pool_metrics
 from core.models.models import DocType, Department, User, Responsible
-from core.schemas import UserRead, UserUpdateSchema, DocTypeUpdate
-from core.security import get_password_hash, get_current_user
+from core.config import settings
+from core.schemas import UserRead, UserUpdateSchema, DocTypeUpdate, UserCreateSchema
+from core.events import notify_principal_changed
+from core.file_gc import collect_orphan_files
+from core.log_tail import LOG_FILES, MAX_LINES, read_log_page, follow_log, decode_log_cursor
+from core.maintenance import JOBS, is_lock_timeout, run_all_maintenance_jobs, run_maintenance_job
+from core.security import get_current_user, principal_cache, password_hasher
 
 router = APIRouter(prefix="/api/admin", tags=["Admin"])
 
 action_logger = logging.getLogger("actions")
 errors_logger = logging.getLogger("errors")
 
-
-def read_last_lines(path: Path, num_lines: int = 200) -> str:
-    """Чтение последних строк из лог-файла."""
-    if not path.exists():
-        return ""
-    with path.open("r", encoding="utf-8") as file:
-        return ''.join(file.readlines()[-num_lines:])
+# Импорт занимает все ядра на время хэширования; одновременно в воркере выполняется один
+_user_import_lock = asyncio.Lock()
 
 
 @router.post("/doc-type")
@@ -45,7 +51,7 @@ async def add_doc_type(
 @router.get("/users", response_model=List[UserRead])
 async def get_users(
     user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_async_session)
+    db: AsyncSession = Depends(get_read_session)
 ):
     """Получение списка всех пользователей."""
     result = await db.execute(
@@ -58,6 +64,134 @@ async def get_users(
     return users
 
 
+def _parse_user_import(filename: str, file: BinaryIO) -> list[dict]:
+    """
+    Строки файла импорта: JSON-массив объектов или CSV с заголовком (разделитель , ; или табуляция).
+    Чтение и разбор синхронные и на большом файле долгие — вызывается в потоке.
+    """
+    data = file.read().decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        rows = json.loads(data)
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("Ожидается JSON-массив объектов")
+        return rows
+    try:
+        dialect = csv.Sniffer().sniff(data[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    return list(csv.DictReader(io.StringIO(data), dialect=dialect))
+
+
+def _import_row_error(number: int, row: dict, *errors: str) -> dict:
+    return {"row": number, "username": row.get("username"), "errors": list(errors)}
+
+
+@router.post("/users/import")
+async def import_users(
+    file: UploadFile = File(...),
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """
+    Массовое создание пользователей из CSV или JSON (поля username, password, name, department_id, admin).
+    Корректные строки создаются, по остальным возвращаются ошибки с номером строки.
+    """
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="Нет доступа")
+    if _user_import_lock.locked():
+        raise HTTPException(status_code=429, detail="Импорт пользователей уже выполняется",
+                            headers={"Retry-After": "10"})
+
+    async with _user_import_lock:
+        try:
+            rows = await asyncio.to_thread(_parse_user_import, file.filename or "", file.file)
+        except (ValueError, csv.Error) as e:
+            raise HTTPException(status_code=400, detail=f"Не удалось прочитать файл: {e}")
+        if len(rows) > settings.USER_IMPORT_MAX_ROWS:
+            raise HTTPException(status_code=400,
+                                detail=f"Не больше {settings.USER_IMPORT_MAX_ROWS} пользователей за один импорт")
+
+        errors = []
+        candidates: list[tuple[int, UserCreateSchema]] = []
+        usernames = set()
+        for number, row in enumerate(rows, start=1):
+            # Пустые ячейки CSV — отсутствующие значения
+            values = {key: value.strip() if isinstance(value, str) else value
+                      for key, value in row.items() if key and value not in ("", None)}
+            try:
+                data = UserCreateSchema.model_validate(values)
+            except ValidationError as e:
+                errors.append(_import_row_error(number, row, *(
+                    f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()
+                )))
+                continue
+            if data.username in usernames:
+                errors.append(_import_row_error(number, row, "Логин повторяется в файле"))
+                continue
+            usernames.add(data.username)
+            candidates.append((number, data))
+
+        # Службы и занятые логины — по одному запросу на весь файл
+        department_ids = {data.department_id for _, data in candidates}
+        existing_departments = set((await db.execute(
+            select(Department.id).where(Department.id.in_(department_ids))
+        )).scalars()) if department_ids else set()
+        taken_usernames = set((await db.execute(
+            select(User.username).where(User.username.in_(usernames))
+        )).scalars()) if usernames else set()
+
+        valid: list[tuple[int, UserCreateSchema]] = []
+        for number, data in candidates:
+            row = {"username": data.username}
+            if data.department_id not in existing_departments:
+                errors.append(_import_row_error(number, row, "Указанная служба не существует"))
+            elif data.username in taken_usernames:
+                errors.append(_import_row_error(number, row, "Пользователь с таким именем уже существует"))
+            else:
+                valid.append((number, data))
+
+        created = []
+        if valid:
+            hashes = await password_hasher.hash_many([data.password for _, data in valid],
+                                                     settings.USER_IMPORT_HASH_WORKERS)
+            # Один INSERT на весь файл: id выдаёт последовательность, логин, занятый параллельно, пропускается
+            try:
+                result = await db.execute(text("""
+                    INSERT INTO users (username, password, name, department_id, admin, create_at)
+                    SELECT u.username, u.password, u.name, u.department_id, u.admin, now()
+                    FROM unnest(
+                        CAST(:usernames AS varchar[]), CAST(:passwords AS varchar[]), CAST(:names AS varchar[]),
+                        CAST(:department_ids AS integer[]), CAST(:admins AS boolean[])
+                    ) AS u(username, password, name, department_id, admin)
+                    ON CONFLICT (username) DO NOTHING
+                    RETURNING id, username
+                """), {
+                    "usernames": [data.username for _, data in valid],
+                    "passwords": hashes,
+                    "names": [data.name for _, data in valid],
+                    "department_ids": [data.department_id for _, data in valid],
+                    "admins": [bool(data.admin) for _, data in valid],
+                })
+                ids = dict((username, user_id) for user_id, username in result.all())
+                await db.commit()
+            except IntegrityError as e:
+                await db.rollback()
+                errors_logger.error(f"Ошибка импорта пользователей: {e}")
+                raise HTTPException(status_code=409, detail="Данные изменились во время импорта, повторите его")
+
+            for number, data in valid:
+                if data.username in ids:
+                    created.append({"row": number, "id": ids[data.username], "username": data.username})
+                else:
+                    errors.append(_import_row_error(number, {"username": data.username},
+                                                    "Пользователь с таким именем уже существует"))
+
+    errors.sort(key=lambda error: error["row"])
+    action_logger.info(f"Пользователь {user.id} импортировал пользователей: создано {len(created)}, "
+                       f"ошибок {len(errors)}")
+    return {"created": created, "errors": errors}
+
+
 @router.put("/users/{user_id}")
 async def update_user(
     user_id: int,
@@ -79,11 +213,13 @@ async def update_user(
     if user_data.department_id is not None:
         user.department_id = user_data.department_id
     if user_data.password:
-        user.password = get_password_hash(user_data.password)
+        user.password = await password_hasher.hash(user_data.password)
     if user_data.admin is not None:
         user.admin = user_data.admin
 
+    await notify_principal_changed(db, user.id)
     await db.commit()
+    principal_cache.invalidate(user.id)
     await db.refresh(user)
 
     action_logger.info(f"Пользователь {current_user.id} обновил информацию о пользователе {user.id}")
@@ -130,7 +266,7 @@ async def remove_responsible(
 @router.get("/assign/")
 async def list_responsibles(
     user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_async_session)
+    db: AsyncSession = Depends(get_read_session)
 ):
     """Список всех ответственных по службам."""
     result = await db.execute(
@@ -207,13 +343,15 @@ async def delete_user(
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
     await db.delete(user_result)
+    await notify_principal_changed(db, user_result.id)
     await db.commit()
+    principal_cache.invalidate(user_result.id)
     action_logger.info(f"Пользователь {user.id} удалил пользователя {user_result.id}")
     return {"status": "deleted"}
 
 
 @router.get("/department")
-async def get_departments(db: AsyncSession = Depends(get_async_session)):
+async def get_departments(db: AsyncSession = Depends(get_read_session)):
     """Получение всех служб (департаментов)."""
     result = await db.execute(select(Department).order_by(Department.name.asc()))
     departments = result.scalars().all()
@@ -251,7 +389,10 @@ async def update_department(
         raise HTTPException(status_code=404, detail="Служба не найдена")
 
     department.name = name
+    # Служба входит в закэшированных пользователей
+    await notify_principal_changed(db)
     await db.commit()
+    principal_cache.clear()
     action_logger.info(f"Пользователь {user.id} изменил службу {name}")
     return department
 
@@ -307,7 +448,8 @@ async def get_action_log(user: User = Depends(get_current_user)):
     """Получение лога действий (только для админов)."""
     if not user.admin:
         raise HTTPException(status_code=403, detail="Нет доступа")
-    return read_last_lines(Path("logs/actions.log"), num_lines=300)
+    lines, _ = await asyncio.to_thread(read_log_page, LOG_FILES["actions"], 300)
+    return "\n".join(lines)
 
 
 @router.get("/errors", response_class=PlainTextResponse)
@@ -315,41 +457,151 @@ async def get_error_log(user: User = Depends(get_current_user)):
     """Получение лога ошибок (только для админов)."""
     if not user.admin:
         raise HTTPException(status_code=403, detail="Нет доступа")
-    return read_last_lines(Path("logs/errors.log"), num_lines=300)
+    lines, _ = await asyncio.to_thread(read_log_page, LOG_FILES["errors"], 300)
+    return "\n".join(lines)
 
 
-@router.post("/cleanup-responsibles")
-async def cleanup_invalid_responsibles(
-    user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_async_session)
+@router.get("/logs/{name}")
+async def get_log_page(
+    name: str,
+    before: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+    limit: int = Query(300, ge=1, le=MAX_LINES),
+    user: User = Depends(get_current_user)
+):
+    """
+    Страница журнала actions или errors от конца к началу, включая ротированные файлы (только для админов).
+    Строки внутри страницы — от старых к новым.
+    """
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="Нет доступа")
+    if name not in LOG_FILES:
+        raise HTTPException(status_code=404, detail="Журнал не найден")
+    try:
+        lines, next_cursor = await asyncio.to_thread(read_log_page, LOG_FILES[name], limit, before)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    return {"lines": lines, "next_cursor": next_cursor}
+
+
+@router.get("/logs/{name}/stream")
+async def stream_log(name: str, request: Request, user: User = Depends(get_current_user)):
+    """
+    Новые строки журнала в реальном времени (Server-Sent Events, только для админов).
+    При переподключении EventSource поток продолжается с Last-Event-ID.
+    """
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="Нет доступа")
+    if name not in LOG_FILES:
+        raise HTTPException(status_code=404, detail="Журнал не найден")
+    path = LOG_FILES[name]
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Журнал ещё не создан")
+    last_event_id = request.headers.get("last-event-id")
+    try:
+        if last_event_id:
+            decode_log_cursor(last_event_id)
+    except ValueError:
+        last_event_id = None
+    return StreamingResponse(
+        follow_log(path, request.is_disconnected, last_event_id),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx не должен копить события в буфере
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/metrics/password-hash")
+async def get_password_hash_metrics(user: User = Depends(get_current_user)):
+    """Очередь и время хэширования паролей в этом воркере (только для админов)."""
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="Нет доступа")
+    return password_hasher.metrics()
+
+
+@router.get("/metrics/db-pool")
+async def get_db_pool_metrics(user: User = Depends(get_current_user)):
+    """Состояние пулов соединений с основной БД и репликой в этом воркере (только для админов)."""
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="Нет доступа")
+    return {
+        "primary": pool_metrics.snapshot(engine.pool),
+        "replica": replica_pool_metrics.snapshot(replica_engine.pool) if replica_engine is not None else None,
+    }
+
+
+@router.get("/maintenance")
+async def list_maintenance_jobs(user: User = Depends(get_current_user)):
+    """Задания обслуживания БД (только для админов)."""
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="Нет доступа")
+    return [{"job": name, "description": description} for name, (description, _) in JOBS.items()]
+
+
+async def _run_single_maintenance_job(name: str, batch_size: Optional[int] = None,
+                                      max_batches: Optional[int] = None) -> dict:
+    """Одно задание обслуживания; lock_timeout — 409 вместо 500, остальные ошибки БД пробрасываются."""
+    try:
+        return await run_maintenance_job(name, batch_size, max_batches)
+    except DBAPIError as e:
+        if not is_lock_timeout(e):
+            raise
+        raise HTTPException(status_code=409, detail="Таблица занята другой операцией, повторите запуск позже")
+
+
+@router.post("/maintenance/{job}")
+async def run_maintenance(
+    job: str,
+    batch_size: Optional[int] = Query(None, ge=1, le=100000),
+    max_batches: Optional[int] = Query(None, ge=1),
+    user: User = Depends(get_current_user)
 ):
+    """Запуск задания обслуживания БД (job=all — всех по очереди)."""
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="Нет доступа")
+    if job == "all":
+        results = await run_all_maintenance_jobs(batch_size, max_batches)
+    elif job in JOBS:
+        results = [await _run_single_maintenance_job(job, batch_size, max_batches)]
+    else:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    action_logger.info(f"Пользователь {user.id} выполнил обслуживание БД: " + ", ".join(
+        f"{result['job']}={result.get('deleted', 'ошибка')}" for result in results
+    ))
+    return results
+
+
+@router.get("/file-gc")
+async def file_gc_report(user: User = Depends(get_current_user)):
+    """
+    Отчёт сборки мусора в UPLOAD_DIR без изменений на диске (только для админов):
+    что будет перенесено в карантин и что удалено из него при следующем запуске.
+    """
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="Нет доступа")
+    return await collect_orphan_files(dry_run=True)
+
+
+@router.post("/file-gc")
+async def run_file_gc_now(user: User = Depends(get_current_user)):
+    """Запуск сборки мусора в UPLOAD_DIR вне расписания (только для админов)."""
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="Нет доступа")
+    report = await collect_orphan_files()
+    if report is None:
+        raise HTTPException(status_code=409, detail="Сборка мусора уже выполняется")
+    action_logger.info(f"Пользователь {user.id} запустил сборку мусора файлов")
+    return report
+
+
+@router.post("/cleanup-responsibles")
+async def cleanup_invalid_responsibles(user: User = Depends(get_current_user)):
     """Очистка таблицы responsibles от записей с несуществующими user_id или department_id."""
     if not user.admin:
         raise HTTPException(status_code=403, detail="Нет доступа")
-    
-    # Находим все записи Responsible
-    result = await db.execute(select(Responsible))
-    all_responsibles = result.scalars().all()
-    
-    deleted_count = 0
-    
-    for responsible in all_responsibles:
-        # Проверяем, существует ли пользователь
-        user_result = await db.execute(select(User).where(User.id == responsible.user_id))
-        user_exists = user_result.scalar_one_or_none()
-        
-        # Проверяем, существует ли департамент  
-        dept_result = await db.execute(select(Department).where(Department.id == responsible.department_id))
-        dept_exists = dept_result.scalar_one_or_none()
-        
-        # Если пользователь или департамент не существуют, удаляем запись
-        if not user_exists or not dept_exists:
-            await db.delete(responsible)
-            deleted_count += 1
-            errors_logger.warning(f"Удалена некорректная запись Responsible: id={responsible.id}, user_id={responsible.user_id}, department_id={responsible.department_id}")
-    
+
+    result = await _run_single_maintenance_job("orphan_responsibles")
+    deleted_count = result["deleted"]
     if deleted_count > 0:
-        await db.commit()
         action_logger.info(f"Пользователь {user.id} очистил {deleted_count} некорректных записей из таблицы responsibles")
-    
+
     return {"message": f"Удалено {deleted_count} некорректных записей", "deleted_count": deleted_count}
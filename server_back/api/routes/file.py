@@ -1,27 +1,128 @@
+import asyncio
 import logging
 import os
-from collections import defaultdict
-from datetime import date, datetime, timedelta
+import re
+from datetime import date, datetime, timedelta, timezone
+from email.utils import formatdate
 from pathlib import Path
-from typing import List, Optional
-
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Body
-from fastapi.responses import FileResponse
-from sqlalchemy import select, delete
+from secrets import token_hex
+from urllib.parse import quote
+from typing import Optional
+
+import anyio
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Body, Query, Request
+from fastapi.responses import FileResponse, Response
+from sqlalchemy import select, insert, tuple_, func, or_, literal, false
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
-from core.db import get_async_session
-from core.models.models import Document, User, DocType, Notification, Responsible, Department
-from core.schemas import DocumentOut
+from core.config import settings
+from core.db import get_async_session, get_read_session, estimate_count
+from core.events import notify_document
+from core.models.models import Document, User, DocType, Notification, NotificationInbox, Responsible, Department
+from core.schemas import DocumentPage, DocumentSearchPage
 from core.security import get_current_user, get_optional_user
-from core.utils import save_file_with_uuid
+from core.storage import blob_path, lock_digests, register_blob, place_blob, store_blob, release_blob, remove_blob_file
+from core.utils import UPLOAD_DIR, save_stream_with_uuid, iter_upload_file, etag_matches, not_modified_since, \
+    encode_cursor, decode_cursor, notification_retention_cutoff
 
 router = APIRouter(prefix='/api/file', tags=['File'])
 error_logger = logging.getLogger("errors")
 action_logger = logging.getLogger("actions")
 
 
+async def create_document(
+        db: AsyncSession,
+        user: User,
+        path: str,
+        original_name: str,
+        size: int,
+        sha256: str,
+        responsible_id: int,
+        doc_type_id: int,
+        doc_number: Optional[str] = None,
+        is_permanent: Optional[bool] = False,
+        valid_until: Optional[date] = None,
+) -> Document:
+    """
+    Создаёт запись документа по уже сохранённому файлу и уведомляет ответственных службы.
+    Файл переносится в хранилище по SHA-256: одинаковое содержимое хранится на диске один раз.
+    Перенос — последний шаг перед коммитом: если запись документа не прошла, файл остаётся по пути path.
+    """
+    is_new_blob = await register_blob(db, sha256, size)
+    new_doc = Document(
+        filename=os.path.basename(path),
+        original_filename=original_name,
+        file_path=blob_path(sha256),
+        blob_digest=sha256,
+        doc_type_id=doc_type_id,
+        responsible_id=responsible_id,
+        valid_until=valid_until,
+        uploaded_by=user.id,
+        uploaded_at=datetime.utcnow(),
+        permanent=is_permanent,
+        file_number=doc_number,
+    )
+
+    db.add(new_doc)
+    await db.flush()
+
+    # Уведомления всей службе одним INSERT ... SELECT в той же транзакции, что и документ
+    result = await db.execute(
+        insert(Notification).from_select(
+            ["file_id", "user_id", "message", "created_at", "is_read"],
+            select(
+                literal(new_doc.id),
+                Responsible.user_id,
+                literal(f'Вам назначен новый файл: {original_name}'),
+                func.now(),
+                false(),
+            ).where(Responsible.department_id == responsible_id).distinct()
+        )
+    )
+    await notify_document(db, new_doc.id)
+    await place_blob(path, sha256, is_new_blob)
+
+    action_logger.info(f"Пользователь {user.id} загрузил файл: {original_name}, уведомлено: {result.rowcount}")
+    await db.commit()
+    return new_doc
+
+
+async def replace_document_content(
+        db: AsyncSession,
+        doc: Document,
+        path: str,
+        original_name: str,
+        size: int,
+        sha256: str,
+) -> None:
+    """Подменяет содержимое документа; старое содержимое удаляется, только если на него больше нет ссылок."""
+    old_digest, old_path = doc.blob_digest, doc.file_path
+
+    # store_blob и release_blob блокируют каждое своё содержимое; обе блокировки берутся заранее в общем порядке
+    await lock_digests(db, sha256, old_digest)
+    doc.file_path = await store_blob(db, path, sha256, size)
+    doc.blob_digest = sha256
+    doc.filename = os.path.basename(path)
+    doc.original_filename = original_name
+    doc.uploaded_at = datetime.utcnow()  # если нужно обновить дату замены
+    await db.flush()
+
+    released = await release_blob(db, old_digest) if old_digest else None
+
+    await db.commit()
+    await db.refresh(doc)
+
+    if released:
+        await remove_blob_file(db, released)
+    elif not old_digest and old_path and os.path.exists(old_path):
+        # Файл, загруженный до появления хранилища, принадлежит только этому документу
+        try:
+            os.remove(old_path)
+        except OSError as e:
+            error_logger.error(f'Не удалось удалить старый файл {old_path}: {e}')
+
+
 @router.post("/upload")
 async def upload_with_route(
         file: UploadFile = File(...),
@@ -37,66 +138,280 @@ async def upload_with_route(
     if not doc_type_obj:
         raise HTTPException(status_code=404, detail="Тип документа не найден")
 
-    path, original_name = await save_file_with_uuid(file)
+    path, size, sha256 = await save_stream_with_uuid(iter_upload_file(file), file.filename)
 
-    new_doc = Document(
-        filename=os.path.basename(path),
-        original_filename=original_name,
-        file_path=path,
-        doc_type_id=doc_type_obj.id,
-        responsible_id=int(responsible),
-        valid_until=valid_until,
-        uploaded_by=user.id,
-        uploaded_at=datetime.utcnow(),
-        permanent=is_permanent,
-        file_number=doc_number,
-    )
+    new_doc = await create_document(db, user, path, file.filename, size, sha256, int(responsible), doc_type_obj.id,
+                                    doc_number, is_permanent, valid_until)
+
+    return {"message": "Документ загружен и маршрут применён", "id": new_doc.id}
+
+
+def _check_content_length(request: Request) -> None:
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.UPLOAD_MAX_SIZE:
+        raise HTTPException(status_code=413, detail="Файл слишком большой")
+
+
+###
+# Потоковая загрузка: тело запроса — сам файл (application/octet-stream), метаданные — в query-параметрах.
+# Файл пишется на диск один раз, порциями, без промежуточного временного файла Starlette.
+###
+@router.post("/upload/stream")
+async def upload_stream(
+        request: Request,
+        filename: str = Query(...),
+        responsible: int = Query(...),
+        doc_type: int = Query(...),
+        doc_number: Optional[str] = Query(None),
+        is_permanent: Optional[bool] = Query(False),
+        valid_until: Optional[date] = Query(None),
+        db: AsyncSession = Depends(get_async_session),
+        user: User = Depends(get_current_user),
+):
+    _check_content_length(request)
+    doc_type_obj = await db.get(DocType, doc_type)
+    if not doc_type_obj:
+        raise HTTPException(status_code=404, detail="Тип документа не найден")
+
+    path, size, sha256 = await save_stream_with_uuid(request.stream(), filename)
+
+    new_doc = await create_document(db, user, path, filename, size, sha256, responsible, doc_type_obj.id,
+                                    doc_number, is_permanent, valid_until)
+
+    return {"message": "Документ загружен и маршрут применён", "id": new_doc.id, "size": size, "sha256": sha256}
 
-    db.add(new_doc)
-    await db.commit()
-    await db.refresh(new_doc)
 
-    responsible_users = await db.execute(
-        select(Responsible).where(Responsible.department_id == int(responsible))
+@router.get("/all", response_model=DocumentPage)
+async def get_files(
+        cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+        limit: int = Query(50, ge=1, le=500),
+        doc_type_id: Optional[int] = Query(None),
+        responsible_id: Optional[int] = Query(None),
+        permanent: Optional[bool] = Query(None),
+        valid_from: Optional[date] = Query(None),
+        valid_to: Optional[date] = Query(None),
+        uploaded_by: Optional[int] = Query(None),
+        with_total: bool = Query(False, description="добавить приблизительное общее число документов"),
+        session: AsyncSession = Depends(get_read_session),
+):
+    # Каждому фильтру соответствует индекс вида (поле, uploaded_at, id) — см. Document.__table_args__
+    filters = []
+    if doc_type_id is not None:
+        filters.append(Document.doc_type_id == doc_type_id)
+    if responsible_id is not None:
+        filters.append(Document.responsible_id == responsible_id)
+    if permanent is not None:
+        filters.append(Document.permanent == permanent)
+    if valid_from is not None:
+        filters.append(Document.valid_until >= valid_from)
+    if valid_to is not None:
+        filters.append(Document.valid_until <= valid_to)
+    if uploaded_by is not None:
+        filters.append(Document.uploaded_by == uploaded_by)
+
+    query = select(Document).where(*filters)
+    if cursor:
+        uploaded_at, last_id = decode_cursor(cursor)
+        query = query.where(tuple_(Document.uploaded_at, Document.id) < tuple_(uploaded_at, last_id))
+
+    result = await session.execute(
+        query.options(
+            joinedload(Document.doc_type),
+            joinedload(Document.responsible)
+        ).order_by(Document.uploaded_at.desc(), Document.id.desc()).limit(limit + 1)
     )
+    documents = result.scalars().all()
 
-    for resp in responsible_users.scalars():
-        db.add(Notification(
-            file_id=new_doc.id,
-            user_id=resp.user_id,
-            message=f'Вам назначен новый файл: {original_name}'
-        ))
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1].uploaded_at, documents[-1].id)
 
-    action_logger.info(f"Пользователь {user.id} загрузил файл: {original_name}")
-    await db.commit()
+    total_estimate = None
+    if with_total:
+        if filters:
+            total_estimate = await estimate_count(session, select(Document.id).where(*filters))
+        else:
+            total_estimate = await estimate_count(session, table="documents")
 
-    return {"message": "Документ загружен и маршрут применён", "id": new_doc.id}
+    return {"items": documents, "next_cursor": next_cursor, "total_estimate": total_estimate}
+
+
+def _prefix_tsquery(q: str) -> Optional[str]:
+    # "догов 12" -> "догов:* & 12:*": каждое слово ищется как префикс, спецсимволы tsquery отбрасываются
+    words = re.findall(r"\w+", q)
+    return " & ".join(f"{word}:*" for word in words) or None
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 
-@router.get("/all", response_model=List[DocumentOut])
-async def get_files(session: AsyncSession = Depends(get_async_session)):
+@router.get("/search", response_model=DocumentSearchPage)
+async def search_files(
+        q: str = Query(..., min_length=1, max_length=200),
+        limit: int = Query(50, ge=1, le=200),
+        offset: int = Query(0, ge=0, le=10000),
+        doc_type_id: Optional[int] = Query(None),
+        responsible_id: Optional[int] = Query(None),
+        session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Поиск по названию, номеру, типу документа и службе.
+    Полнотекстовое совпадение (ix_documents_search_vector) ранжируется выше,
+    триграммы (ix_documents_*_trgm) находят опечатки и подстроки.
+    """
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="Пустой запрос")
+
+    conditions = [
+        literal(q).op("<%")(Document.original_filename),
+        Document.original_filename.ilike(f"%{_escape_like(q)}%"),
+        Document.file_number.ilike(f"{_escape_like(q)}%"),
+    ]
+    rank = func.greatest(
+        func.word_similarity(q, Document.original_filename),
+        func.similarity(func.coalesce(Document.file_number, ""), q),
+    )
+    prefix_query = _prefix_tsquery(q)
+    if prefix_query:
+        tsquery = func.to_tsquery("russian", prefix_query).op("||")(func.to_tsquery("simple", prefix_query))
+        conditions.append(Document.search_vector.op("@@")(tsquery))
+        rank = rank + func.ts_rank_cd(Document.search_vector, tsquery)
+
+    filters = [or_(*conditions)]
+    if doc_type_id is not None:
+        filters.append(Document.doc_type_id == doc_type_id)
+    if responsible_id is not None:
+        filters.append(Document.responsible_id == responsible_id)
+
     result = await session.execute(
-        select(Document).options(
+        select(Document)
+        .where(*filters)
+        .options(
             joinedload(Document.doc_type),
             joinedload(Document.responsible)
-        ).order_by(Document.uploaded_at.desc())
+        )
+        .order_by(rank.desc(), Document.uploaded_at.desc(), Document.id.desc())
+        .offset(offset)
+        .limit(limit + 1)
     )
-    return result.scalars().all()
+    documents = result.scalars().all()
+
+    next_offset = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_offset = offset + limit
+
+    return {"items": documents, "next_offset": next_offset}
+
+
+class DownloadResponse(FileResponse):
+    """FileResponse с корректным ответом на запрос нескольких диапазонов (multipart/byteranges, RFC 9110)."""
+
+    async def _handle_multiple_ranges(self, send, ranges, file_size, send_header_only) -> None:
+        boundary = token_hex(13)
+        content_type = self.headers["content-type"]
+        part_headers = [
+            (b"\r\n" if i else b"") + (
+                f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{end - 1}/{file_size}\r\n\r\n"
+            ).encode("latin-1")
+            for i, (start, end) in enumerate(ranges)
+        ]
+        closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        self.headers["content-length"] = str(
+            sum(len(h) for h in part_headers) + sum(end - start for start, end in ranges) + len(closing)
+        )
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            for header, (start, end) in zip(part_headers, ranges):
+                await send({"type": "http.response.body", "body": header, "more_body": True})
+                await file.seek(start)
+                while start < end:
+                    chunk = await file.read(min(self.chunk_size, end - start))
+                    start += len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": closing, "more_body": False})
+
+
+def _validators(doc: Document, stat_result: Optional[os.stat_result]) -> tuple[str, float]:
+    """ETag и время изменения документа: для хранилища — по SHA-256 содержимого, для старых файлов — по размеру и mtime."""
+    if doc.blob_digest:
+        return f'"{doc.blob_digest}"', doc.uploaded_at.replace(tzinfo=timezone.utc).timestamp()
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"', stat_result.st_mtime
+
+
+def _offload_response(doc: Document, download_name: str, headers: dict) -> Response:
+    headers = dict(headers)
+    quoted_name = quote(download_name)
+    if quoted_name != download_name:
+        headers["content-disposition"] = f"attachment; filename*=utf-8''{quoted_name}"
+    else:
+        headers["content-disposition"] = f'attachment; filename="{download_name}"'
+
+    if settings.DOWNLOAD_OFFLOAD == "nginx":
+        relative_path = os.path.relpath(doc.file_path, UPLOAD_DIR).replace(os.sep, "/")
+        headers["x-accel-redirect"] = settings.DOWNLOAD_OFFLOAD_LOCATION.rstrip("/") + "/" + quote(relative_path)
+    elif settings.DOWNLOAD_OFFLOAD == "sendfile":
+        headers["x-sendfile"] = os.path.abspath(doc.file_path)
+    else:
+        raise HTTPException(status_code=500, detail=f"Неизвестный режим отдачи файлов: {settings.DOWNLOAD_OFFLOAD}")
+    return Response(media_type="application/octet-stream", headers=headers)
+
+
+async def _stat_or_404(doc: Document) -> os.stat_result:
+    try:
+        return await asyncio.to_thread(os.stat, doc.file_path)
+    except FileNotFoundError:
+        error_logger.error(f'Ошибка скачивания файла: {doc.id}')
+        raise HTTPException(status_code=404, detail="Файл не найден")
 
 
-@router.get("/download/{file_id}")
-async def get_file(file_id: int, db: AsyncSession = Depends(get_async_session),
+@router.api_route("/download/{file_id}", methods=["GET", "HEAD"])
+async def get_file(file_id: int, request: Request, db: AsyncSession = Depends(get_async_session),
                    user: Optional[User] = Depends(get_optional_user)):
     doc = await db.get(Document, file_id)
-    if not doc or not os.path.exists(doc.file_path):
+    if not doc:
         error_logger.error(f'Ошибка скачивания файла: {file_id}')
         raise HTTPException(status_code=404, detail="Файл не найден")
-    return FileResponse(doc.file_path, media_type="application/octet-stream",
-                        filename=doc.original_filename + Path(doc.file_path).suffix)
+
+    # Для файлов из хранилища валидаторы берутся из БД, и ответ 304 отдаётся без обращения к диску
+    stat_result = None
+    if not doc.blob_digest:
+        stat_result = await _stat_or_404(doc)
+    etag, mtime = _validators(doc, stat_result)
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(mtime, usegmt=True),
+        "cache-control": "private, no-cache",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, etag) or (
+            if_none_match is None and not_modified_since(request.headers.get("if-modified-since"), mtime)):
+        return Response(status_code=304, headers=headers)
+
+    download_name = doc.original_filename + Path(doc.filename).suffix
+    if settings.DOWNLOAD_OFFLOAD:
+        # Права и метаданные проверены здесь, сами байты отдаёт обратный прокси
+        return _offload_response(doc, download_name, headers)
+
+    if stat_result is None:
+        stat_result = await _stat_or_404(doc)
+    # FileResponse сам обрабатывает Range, If-Range и multipart/byteranges, используя переданные ETag и Last-Modified
+    return DownloadResponse(doc.file_path, media_type="application/octet-stream", headers=headers,
+                        stat_result=stat_result, filename=download_name)
 
 
 @router.get("/info/{file_id}")
-async def get_file_info(file_id: int, db: AsyncSession = Depends(get_async_session),
+async def get_file_info(file_id: int, db: AsyncSession = Depends(get_read_session),
                         user: User = Depends(get_optional_user)):
     doc = await db.get(Document, file_id)
     if not doc:
@@ -114,81 +429,156 @@ async def get_file_info(file_id: int, db: AsyncSession = Depends(get_async_sessi
 
 
 @router.get("/my")
-async def get_my_files(db: AsyncSession = Depends(get_async_session), user: User = Depends(get_current_user)):
-    # Получаем документы, загруженные пользователем
+async def get_my_files(
+        cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+        limit: int = Query(50, ge=1, le=500),
+        db: AsyncSession = Depends(get_read_session),
+        user: User = Depends(get_current_user),
+):
+    # Страница документов пользователя (индекс ix_documents_uploaded_by_uploaded_at)
+    query = select(Document).where(Document.uploaded_by == user.id)
+    if cursor:
+        uploaded_at, last_id = decode_cursor(cursor)
+        query = query.where(tuple_(Document.uploaded_at, Document.id) < tuple_(uploaded_at, last_id))
     result = await db.execute(
-        select(Document)
-        .where(Document.uploaded_by == user.id)
-        .order_by(Document.uploaded_at.desc())
+        query.options(joinedload(Document.doc_type))
+        .order_by(Document.uploaded_at.desc(), Document.id.desc())
+        .limit(limit + 1)
     )
     documents = result.scalars().all()
-    document_ids = [doc.id for doc in documents]
 
-    if not document_ids:
-        return []
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1].uploaded_at, documents[-1].id)
+
+    # Счётчики прочтения считаются в БД; списки читателей — в /readers/{file_id}
+    counts = {}
+    if documents:
+        result = await db.execute(
+            select(
+                Notification.file_id,
+                func.count(func.distinct(Notification.user_id)).label("total"),
+                func.count(func.distinct(Notification.user_id)).filter(Notification.is_read).label("read"),
+            )
+            .where(
+                Notification.file_id.in_([doc.id for doc in documents]),
+                Notification.user_id.in_(select(Responsible.user_id)),
+                Notification.created_at >= notification_retention_cutoff(),
+            )
+            .group_by(Notification.file_id)
+        )
+        counts = {row.file_id: (row.total, row.read) for row in result}
+
+    items = []
+    for doc in documents:
+        total, read = counts.get(doc.id, (0, 0))
+        items.append({
+            "id": doc.id,
+            "original_filename": doc.original_filename,
+            "doc_type": doc.doc_type,
+            "valid_until": doc.valid_until,
+            "uploaded_at": doc.uploaded_at,
+            "total_responsibles": total,
+            "read_count": read,
+            "unread_count": total - read,
+        })
+
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@router.get("/readers/{file_id}")
+async def get_file_readers(file_id: int, db: AsyncSession = Depends(get_read_session),
+                           user: User = Depends(get_current_user)):
+    """Кто из ответственных прочитал документ, а кто нет."""
+    doc = await db.get(Document, file_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Файл не найден")
+    if doc.uploaded_by != user.id and not user.admin:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
 
-    # Загружаем уведомления + ответственные + пользователи + отделы
     result = await db.execute(
-        select(Notification, Responsible, User, Department)
+        select(
+            User.name.label("user_name"),
+            func.min(Department.name).label("department_name"),
+            func.bool_or(Notification.is_read).label("is_read"),
+        )
+        .select_from(Notification)
         .join(Responsible, Responsible.user_id == Notification.user_id)
-        .join(User, User.id == Responsible.user_id)
+        .join(User, User.id == Notification.user_id)
         .join(Department, Department.id == Responsible.department_id)
-        .where(Notification.file_id.in_(document_ids))
+        .where(Notification.file_id == file_id, Notification.created_at >= notification_retention_cutoff())
+        .group_by(User.id)
+        .order_by(User.name)
+    )
+
+    read_by, unread_by = [], []
+    for row in result:
+        responsible_info = {"department_id": row.department_name, "user_id": row.user_name}
+        (read_by if row.is_read else unread_by).append(responsible_info)
+    return {"read_by": read_by, "unread_by": unread_by}
+
+
+@router.get("/inwork")
+async def get_files_in_work(
+        cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+        limit: int = Query(50, ge=1, le=500),
+        is_read: Optional[bool] = Query(None, description="true — только прочитанные, false — с непрочитанными"),
+        expired: Optional[bool] = Query(None, description="true — срок действия истёк, false — действующие"),
+        valid_to: Optional[date] = Query(None, description="срок действия истекает не позже даты"),
+        db: AsyncSession = Depends(get_read_session),
+        user: User = Depends(get_current_user),
+):
+    # Уведомления пользователя, свёрнутые до строки на документ триггерами (notification_inbox):
+    # страница читается по индексу ix_notification_inbox_user_notified и останавливается после limit + 1 строк
+    is_read_column = (NotificationInbox.unread == 0).label("is_read")
+    query = (
+        select(Document, NotificationInbox.notified_at, is_read_column)
+        .join(NotificationInbox, NotificationInbox.file_id == Document.id)
+        .where(NotificationInbox.user_id == user.id)
+    )
+    if is_read is False:
+        query = query.where(NotificationInbox.unread > 0)
+    elif is_read:
+        query = query.where(NotificationInbox.unread == 0)
+    today = date.today()
+    if expired is True:
+        query = query.where(Document.valid_until < today)
+    elif expired is False:
+        query = query.where((Document.valid_until.is_(None)) | (Document.valid_until >= today))
+    if valid_to is not None:
+        query = query.where(Document.valid_until <= valid_to)
+    if cursor:
+        notified_at, last_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(NotificationInbox.notified_at, NotificationInbox.file_id) < tuple_(notified_at, last_id)
+        )
+
+    result = await db.execute(
+        query.options(
+            joinedload(Document.doc_type),
+            joinedload(Document.responsible)
+        ).order_by(NotificationInbox.notified_at.desc(), NotificationInbox.file_id.desc()).limit(limit + 1)
     )
     rows = result.all()
 
-    # Словарь: doc_id -> {"read_by": {user_id: {...}}, "unread_by": {user_id: {...}}}
-    notifications_by_doc = defaultdict(lambda: {"read_by": {}, "unread_by": {}})
-
-    for note, responsible, user_obj, department in rows:
-        user_key = user_obj.id
-        responsible_info = {
-            "department_id": department.name,
-            "user_id": user_obj.name
-        }
-        group = "read_by" if note.is_read else "unread_by"
-        # Добавляем только если такого пользователя ещё нет
-        if user_key not in notifications_by_doc[note.file_id][group]:
-            notifications_by_doc[note.file_id][group][user_key] = responsible_info
-
-    # Формируем ответ
-    response = []
-    for doc in documents:
-        notif = notifications_by_doc.get(doc.id, {"read_by": {}, "unread_by": {}})
-        read_by = list(notif["read_by"].values())
-        unread_by = list(notif["unread_by"].values())
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].notified_at, rows[-1].Document.id)
 
-        response.append({
+    return {
+        "items": [{
             "id": doc.id,
             "original_filename": doc.original_filename,
             "doc_type": doc.doc_type,
+            "responsible": doc.responsible,
             "valid_until": doc.valid_until,
-            "uploaded_at": doc.uploaded_at,
-            "total_responsibles": len(read_by) + len(unread_by),
-            "read_count": len(read_by),
-            "unread_count": len(unread_by),
-            "read_by": read_by,
-            "unread_by": unread_by,
-        })
-
-    return response
-
-
-@router.get("/inwork")
-async def get_files_in_work(db: AsyncSession = Depends(get_async_session), user: User = Depends(get_current_user)):
-    notifications = await db.execute(select(Notification).where(Notification.user_id == user.id))
-    docs = []
-    for notif in notifications.scalars():
-        doc = await db.get(Document, notif.file_id)
-        if doc:
-            docs.append(doc)
-    return [{
-        "id": doc.id,
-        "original_filename": doc.original_filename,
-        "doc_type": doc.doc_type,
-        "responsible": doc.responsible,
-        "valid_until": doc.valid_until
-    } for doc in docs]
+            "notified_at": notified_at,
+            "is_read": read,
+        } for doc, notified_at, read in rows],
+        "next_cursor": next_cursor,
+    }
 
 
 @router.put("/update/{file_id}")
@@ -269,31 +659,48 @@ async def replace_file(
     if doc.uploaded_by != user.id and user.admin is not True:
         raise HTTPException(status_code=403, detail="Доступ запрещён")
 
-    # Удаление старого файла, если он существует
-    if doc.file_path and os.path.exists(doc.file_path):
-        try:
-            os.remove(doc.file_path)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Ошибка удаления файла: {e}")
+    # Сохранение нового файла; старый удаляется только после успешного коммита
+    new_path, size, sha256 = await save_stream_with_uuid(iter_upload_file(file), file.filename)
+    await replace_document_content(db, doc, new_path, file.filename, size, sha256)
+
+    return {
+        "status": "file replaced",
+        "id": doc.id,
+        "original_filename": doc.original_filename,
+        "filename": doc.filename,
+        "uploaded_at": doc.uploaded_at,
+    }
 
-    # Сохранение нового файла
-    new_path, new_name = await save_file_with_uuid(file)
 
-    # Обновляем документ
-    doc.filename = os.path.basename(new_path)
-    doc.original_filename = new_name
-    doc.file_path = new_path
-    doc.uploaded_at = datetime.utcnow()  # если нужно обновить дату замены
+@router.put("/replace/{file_id}/stream")
+async def replace_file_stream(
+        file_id: int,
+        request: Request,
+        filename: str = Query(...),
+        user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_session),
+):
+    _check_content_length(request)
+    doc = await db.get(Document, file_id)
 
-    await db.commit()
-    await db.refresh(doc)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Файл не найден")
+    if doc.uploaded_by != user.id and user.admin is not True:
+        raise HTTPException(status_code=403, detail="Доступ запрещён")
+
+    # Сначала сохраняем новый файл, старый удаляем только после успешного коммита
+    new_path, size, sha256 = await save_stream_with_uuid(request.stream(), filename)
+    await replace_document_content(db, doc, new_path, filename, size, sha256)
 
+    action_logger.info(f"Пользователь {user.id} заменил файл {doc.id}: {filename}")
     return {
         "status": "file replaced",
         "id": doc.id,
         "original_filename": doc.original_filename,
         "filename": doc.filename,
         "uploaded_at": doc.uploaded_at,
+        "size": size,
+        "sha256": sha256,
     }
 
 
@@ -305,18 +712,22 @@ async def delete_file(file_id: int, db: AsyncSession = Depends(get_async_session
         error_logger.error(f'Ошибка удаления файла {file_id}')
         raise HTTPException(status_code=403, detail="Файл не найден или недостаточно прав")
 
-    await db.execute(delete(Notification).where(Notification.file_id == file_id))  # Удаление уведомлений на этот файл
+    # Уведомления удаляются каскадом (ON DELETE CASCADE, индекс ix_notifications_file_id)
     await db.delete(doc)
+    await db.flush()
+    released = await release_blob(db, doc.blob_digest) if doc.blob_digest else None
     await db.commit()
 
-    if os.path.exists(doc.file_path):
+    if released:
+        await remove_blob_file(db, released)
+    elif not doc.blob_digest and os.path.exists(doc.file_path):
         os.remove(doc.file_path)
     action_logger.info(f'Пользователь {user.id} удалил файл {file_id}')
     return {"status": "deleted"}
 
 
 @router.get("/doc-type")
-async def get_all_doc_types_and_departments(db: AsyncSession = Depends(get_async_session)):
+async def get_all_doc_types_and_departments(db: AsyncSession = Depends(get_read_session)):
     result = await db.execute(select(DocType))
     doc_types = result.scalars().all()
     if not doc_types:
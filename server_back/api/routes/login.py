@@ -3,16 +3,15 @@ import logging
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.requests import Request
 from jose import jwt, JWTError
-from sqlalchemy import select, func
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
 from starlette.responses import JSONResponse
 
 from core.db import get_async_session
 from core.models.models import User, Department
 from core.schemas import UserLogin, UserCreateSchema, UserRead
-from core.security import verify_password, create_access_token, SECRET_KEY, ALGORITHM, get_password_hash, \
-    get_current_user
+from core.security import create_access_token, SECRET_KEY, ALGORITHM, get_current_user, get_user_by_token, \
+    password_hasher
 
 router = APIRouter(prefix='/api/auth', tags=['Login'])
 error_logger = logging.getLogger("errors")
@@ -28,7 +27,7 @@ async def login(user: UserLogin, db: AsyncSession = Depends(get_async_session)):
     result = await db.execute(select(User).where(User.username == user.username))
     db_user = result.scalar_one_or_none()
 
-    if not db_user or not verify_password(user.password, db_user.password):
+    if not db_user or not await password_hasher.verify(user.password, db_user.password):
         error_logger.error(f'Неудачная попытка входа: {user}')
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
@@ -59,16 +58,8 @@ async def login(user: UserLogin, db: AsyncSession = Depends(get_async_session)):
 
 
 @router.get("/user_info", response_model=UserRead)
-async def get_user_info(user: User = Depends(get_current_user),
-                        db: AsyncSession = Depends(get_async_session)):
-    result = await db.execute(
-        select(User).where(User.id == user.id).options(joinedload(User.department))
-    )
-    user = result.scalar_one_or_none()
-    if not user:
-        error_logger.error('Пользователь не найдень')
-        raise HTTPException(status_code=404, detail="Пользователь не найден")
-
+async def get_user_info(user: User = Depends(get_current_user)):
+    # get_current_user уже загрузил пользователя вместе со службой
     return user
 
 
@@ -88,17 +79,14 @@ async def logout(user: User = Depends(get_current_user)):
 # Проверяем существует ли пользователь и его авторизация актуальна, для действий с обязательной авторизацией
 ###
 @router.get("/check_auth")
-async def get_me(request: Request, db: AsyncSession = Depends(get_async_session)):
+async def get_me(request: Request):
     token = request.cookies.get("token")
     if not token:
         error_logger.error(f'Ошибка проверки аутентификации, нет токена')
         raise HTTPException(status_code=401, detail="Not authenticated, token is missing")
 
-    payload = decode_access_token(token)
-    user_id = payload.get("id")
-
-    result = await db.execute(select(User).where(User.id == user_id))
-    db_user = result.scalar_one_or_none()
+    decode_access_token(token)
+    db_user = await get_user_by_token(token)
 
     if not db_user:
         error_logger.error(f'Ошибка проверки аутентификации, пользователь не найден')
@@ -147,15 +135,9 @@ async def register_user(
         error_logger.error(f'Ошибка регистрации пользователя, не найден указанная служба')
         raise HTTPException(status_code=400, detail="Указанная служба не существует")
 
-    # Получаем максимальный id
-    max_id_result = await db.execute(select(func.max(User.id)))
-    max_id = max_id_result.scalar() or 0
-    next_id = max_id + 1
-
     new_user = User(
-        id=next_id,  # Указываем ID вручную
         username=user_data.username,
-        password=get_password_hash(user_data.password),
+        password=await password_hasher.hash(user_data.password),
         name=user_data.name,
         department_id=user_data.department_id,
         admin=getattr(user_data, 'admin', False)  # Поддержка admin поля
@@ -1,14 +1,19 @@
+import asyncio
 import logging
-from typing import List
+from datetime import timezone
+from typing import List, Optional
 
-from fastapi import APIRouter, status, Depends, HTTPException
-from sqlalchemy import select
+from fastapi import APIRouter, status, Depends, HTTPException, WebSocket, WebSocketDisconnect, Query, Request
+from fastapi.responses import Response, JSONResponse
+from sqlalchemy import select, update, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.db import get_async_session
-from core.models.models import Notification
-from core.schemas import NotificationCreate
-from core.security import get_current_user
+from core.db import get_async_session, get_read_session
+from core.events import hub, notify_notifications, notify_read, notification_to_dict
+from core.models.models import Notification, NotificationCounter
+from core.schemas import NotificationCreate, NotificationBulkRead
+from core.security import get_current_user, get_user_by_token
+from core.utils import encode_cursor, decode_cursor, etag_matches, notification_retention_cutoff
 
 router = APIRouter(prefix='/api/notification', tags=['Notification'])
 error_logger = logging.getLogger("errors")
@@ -27,13 +32,14 @@ async def create_notification(
         message=notification_data.message,
     )
     db.add(new_notification)
+    await notify_notifications(db, [new_notification])
     await db.commit()
     return {"message": "Уведомление создано"}
 
 
 @router.get("/", response_model=List[dict])
 async def get_notifications(
-        db: AsyncSession = Depends(get_async_session),
+        db: AsyncSession = Depends(get_read_session),
         user=Depends(get_current_user)
 ):
     if not user:
@@ -42,6 +48,7 @@ async def get_notifications(
         select(Notification)
         .where(Notification.user_id == user.id)
         .where(Notification.is_read == False)
+        .where(Notification.created_at >= notification_retention_cutoff())
         .order_by(Notification.created_at.desc())
     )
     notifications = result.scalars().all()
@@ -58,6 +65,96 @@ async def get_notifications(
     ]
 
 
+@router.get("/count")
+async def get_unread_count(
+        request: Request,
+        db: AsyncSession = Depends(get_async_session),
+        user=Depends(get_current_user)
+):
+    """
+    Число непрочитанных уведомлений (notification_counters). При неизменном значении — 304.
+    Читается из основной БД: клиент запрашивает его сразу после события WebSocket, и реплика может
+    ещё не догнать запись; это чтение одной строки по ключу.
+    """
+    unread = await db.scalar(
+        select(NotificationCounter.unread).where(NotificationCounter.user_id == user.id)
+    ) or 0
+    etag = f'W/"unread-{user.id}-{unread}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({"unread": unread}, headers=headers)
+
+
+@router.get("/history")
+async def get_notification_history(
+        cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+        limit: int = Query(50, ge=1, le=200),
+        is_read: Optional[bool] = Query(None),
+        db: AsyncSession = Depends(get_read_session),
+        user=Depends(get_current_user)
+):
+    """Все уведомления пользователя, включая прочитанные, от новых к старым."""
+    query = select(Notification).where(
+        Notification.user_id == user.id, Notification.created_at >= notification_retention_cutoff()
+    )
+    if is_read is not None:
+        query = query.where(Notification.is_read == is_read)
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        query = query.where(tuple_(Notification.created_at, Notification.id) < tuple_(created_at, last_id))
+
+    result = await db.execute(
+        query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit + 1)
+    )
+    notifications = result.scalars().all()
+
+    next_cursor = None
+    if len(notifications) > limit:
+        notifications = notifications[:limit]
+        next_cursor = encode_cursor(notifications[-1].created_at, notifications[-1].id)
+
+    return {"items": [notification_to_dict(n) for n in notifications], "next_cursor": next_cursor}
+
+
+@router.patch("/read")
+async def mark_many_as_read(
+        data: NotificationBulkRead,
+        db: AsyncSession = Depends(get_async_session),
+        user=Depends(get_current_user)
+):
+    """
+    Отмечает прочитанными уведомления по списку id, по документу или созданные не позже before.
+    Условия можно сочетать; выполняется одним UPDATE ... RETURNING.
+    """
+    conditions = []
+    if data.ids is not None:
+        conditions.append(Notification.id.in_(data.ids))
+    if data.file_id is not None:
+        conditions.append(Notification.file_id == data.file_id)
+    if data.before is not None:
+        # created_at хранится без часового пояса (now() сервера БД в UTC)
+        before = data.before
+        if before.tzinfo is not None:
+            before = before.astimezone(timezone.utc).replace(tzinfo=None)
+        conditions.append(Notification.created_at <= before)
+    if not conditions:
+        raise HTTPException(status_code=400, detail="Укажите ids, file_id или before")
+
+    result = await db.execute(
+        update(Notification)
+        .where(Notification.user_id == user.id, Notification.is_read.is_(False), *conditions)
+        .values(is_read=True)
+        .returning(Notification.id)
+    )
+    ids = list(result.scalars())
+    if ids:
+        await notify_read(db, user.id, ids)
+    await db.commit()
+    action_logger.info(f'Пользователь {user.id} отметил прочитанными уведомлений: {len(ids)}')
+    return {"message": "Отмечено как прочитанное", "ids": ids}
+
+
 @router.patch("/{notification_id}/read")
 async def mark_as_read(
         notification_id: int,
@@ -73,6 +170,45 @@ async def mark_as_read(
         raise HTTPException(status_code=404, detail="Уведомление не найдено")
 
     notification.is_read = True
+    await notify_read(db, user.id, [notification.id])
     await db.commit()
     action_logger.info(f'{user} прочитал уведомление {notification}')
     return {"message": "Отмечено как прочитанное"}
+
+
+async def _wait_disconnect(websocket: WebSocket) -> None:
+    # Клиент ничего не отправляет; чтение нужно только чтобы заметить закрытие соединения
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+
+
+@router.websocket("/ws")
+async def notifications_ws(websocket: WebSocket):
+    """
+    Поток событий уведомлений текущего пользователя (авторизация по cookie token).
+    Клиент после каждого подключения сам перечитывает GET /api/notification/, дальше применяет события.
+    """
+    user = await get_user_by_token(websocket.cookies.get("token"))
+    if not user:
+        await websocket.close(code=4401)
+        return
+
+    await websocket.accept()
+    queue = hub.subscribe(user.id)
+    disconnected = asyncio.create_task(_wait_disconnect(websocket))
+    try:
+        while True:
+            next_event = asyncio.create_task(queue.get())
+            await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                next_event.cancel()
+                break
+            await websocket.send_json(next_event.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.unsubscribe(user.id, queue)
+        disconnected.cancel()
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select, func, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.routes.file import create_document
+from core.config import settings
+from core.db import get_async_session
+from core.models.models import User, DocType, UploadSession, UploadChunk
+from core.schemas import UploadSessionCreate
+from core.security import get_current_user
+from core.storage import blob_path
+from core.utils import create_session_file, remove_session_file, write_stream_at, finalize_session_file, \
+    restore_session_file
+
+router = APIRouter(prefix='/api/file/session', tags=['Upload session'])
+error_logger = logging.getLogger("errors")
+action_logger = logging.getLogger("actions")
+
+# Ограничивает число одновременно записываемых частей (и их буферов) в одном воркере
+_write_slots = asyncio.Semaphore(settings.UPLOAD_SESSION_MAX_PARALLEL_WRITES)
+
+
+def _chunk_count(upload: UploadSession) -> int:
+    return max(1, -(-upload.total_size // upload.chunk_size))
+
+
+def _chunk_length(upload: UploadSession, index: int) -> int:
+    if index == _chunk_count(upload) - 1:
+        return upload.total_size - index * upload.chunk_size
+    return upload.chunk_size
+
+
+async def _get_own_session(db: AsyncSession, session_id: str, user: User, for_update: bool = False,
+                           for_share: bool = False) -> UploadSession:
+    query = select(UploadSession).where(UploadSession.id == session_id)
+    if for_update:
+        query = query.with_for_update()
+    elif for_share:
+        query = query.with_for_update(read=True)
+    upload = (await db.execute(query)).scalar_one_or_none()
+    if not upload or upload.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Сессия загрузки не найдена")
+    if upload.expires_at < datetime.utcnow():
+        raise HTTPException(status_code=410, detail="Сессия загрузки истекла")
+    return upload
+
+
+async def _received(db: AsyncSession, session_id: str) -> list[tuple[int, int]]:
+    result = await db.execute(
+        select(UploadChunk.index, UploadChunk.size)
+        .where(UploadChunk.session_id == session_id)
+        .order_by(UploadChunk.index)
+    )
+    return [(index, size) for index, size in result.all()]
+
+
+@router.post("/")
+async def create_upload_session(
+        data: UploadSessionCreate,
+        db: AsyncSession = Depends(get_async_session),
+        user: User = Depends(get_current_user),
+):
+    """Создание сессии загрузки по частям."""
+    if data.total_size <= 0 or data.total_size > settings.UPLOAD_MAX_SIZE:
+        raise HTTPException(status_code=413, detail="Недопустимый размер файла")
+
+    chunk_size = data.chunk_size or settings.UPLOAD_SESSION_CHUNK_SIZE
+    if chunk_size <= 0 or chunk_size > settings.UPLOAD_SESSION_MAX_CHUNK_SIZE:
+        raise HTTPException(status_code=400, detail="Недопустимый размер части")
+
+    if not await db.get(DocType, data.doc_type):
+        raise HTTPException(status_code=404, detail="Тип документа не найден")
+
+    # Лимиты на незавершённые загрузки пользователя
+    active_count, pending_bytes = (await db.execute(
+        select(func.count(UploadSession.id), func.coalesce(func.sum(UploadSession.total_size), 0))
+        .where(UploadSession.user_id == user.id, UploadSession.expires_at >= datetime.utcnow())
+    )).one()
+    if active_count >= settings.UPLOAD_SESSION_MAX_ACTIVE:
+        raise HTTPException(status_code=429, detail="Слишком много незавершённых загрузок")
+    if pending_bytes + data.total_size > settings.UPLOAD_SESSION_MAX_PENDING_BYTES:
+        raise HTTPException(status_code=429, detail="Превышен объём незавершённых загрузок")
+
+    upload = UploadSession(
+        id=str(uuid.uuid4()),
+        user_id=user.id,
+        filename=data.filename,
+        total_size=data.total_size,
+        chunk_size=chunk_size,
+        responsible_id=data.responsible,
+        doc_type_id=data.doc_type,
+        file_number=data.doc_number,
+        permanent=data.is_permanent,
+        valid_until=data.valid_until,
+        expires_at=datetime.utcnow() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS),
+    )
+    await asyncio.to_thread(create_session_file, upload.id, upload.total_size)
+    db.add(upload)
+    await db.commit()
+
+    action_logger.info(f"Пользователь {user.id} начал загрузку по частям {upload.id}: {upload.filename}")
+    return {
+        "id": upload.id,
+        "chunk_size": upload.chunk_size,
+        "chunk_count": _chunk_count(upload),
+        "expires_at": upload.expires_at,
+    }
+
+
+@router.put("/{session_id}/chunk/{index}")
+async def upload_chunk(
+        session_id: str,
+        index: int,
+        request: Request,
+        db: AsyncSession = Depends(get_async_session),
+        user: User = Depends(get_current_user),
+):
+    """Приём одной части. Повторная отправка той же части перезаписывает её."""
+    # FOR SHARE до коммита: части пишутся параллельно, а finalize (FOR UPDATE) ждёт, пока они запишутся,
+    # и не хэширует файл, который ещё меняется. Часть, пришедшая после finalize, сессию уже не найдёт
+    upload = await _get_own_session(db, session_id, user, for_share=True)
+    if index < 0 or index >= _chunk_count(upload):
+        raise HTTPException(status_code=400, detail="Неверный номер части")
+
+    expected = _chunk_length(upload, index)
+    async with _write_slots:
+        try:
+            written = await write_stream_at(session_id, index * upload.chunk_size, request.stream(), expected)
+        except FileNotFoundError:
+            raise HTTPException(status_code=410, detail="Файл сессии загрузки не найден")
+    if written != expected:
+        raise HTTPException(status_code=400, detail=f"Часть {index} получена не полностью: {written} из {expected}")
+
+    await db.execute(
+        insert(UploadChunk)
+        .values(session_id=session_id, index=index, size=written)
+        .on_conflict_do_update(
+            index_elements=[UploadChunk.session_id, UploadChunk.index],
+            set_={"size": written, "received_at": func.now()},
+        )
+    )
+    await db.commit()
+    return {"index": index, "size": written}
+
+
+@router.get("/{session_id}")
+async def get_upload_session(
+        session_id: str,
+        db: AsyncSession = Depends(get_async_session),
+        user: User = Depends(get_current_user),
+):
+    """Состояние сессии: какие части и диапазоны байт уже получены."""
+    upload = await _get_own_session(db, session_id, user)
+    received = await _received(db, session_id)
+    return {
+        "id": upload.id,
+        "filename": upload.filename,
+        "total_size": upload.total_size,
+        "chunk_size": upload.chunk_size,
+        "chunk_count": _chunk_count(upload),
+        "received": [index for index, _ in received],
+        "received_bytes": sum(size for _, size in received),
+        "offsets": [[index * upload.chunk_size, index * upload.chunk_size + size] for index, size in received],
+        "expires_at": upload.expires_at,
+    }
+
+
+@router.post("/{session_id}/finalize")
+async def finalize_upload_session(
+        session_id: str,
+        db: AsyncSession = Depends(get_async_session),
+        user: User = Depends(get_current_user),
+):
+    """Сборка файла и создание документа с теми же метаданными, что и в /api/file/upload."""
+    upload = await _get_own_session(db, session_id, user, for_update=True)
+    received = await _received(db, session_id)
+    missing = sorted(set(range(_chunk_count(upload))) - {index for index, _ in received})
+    if missing:
+        raise HTTPException(status_code=409, detail={"message": "Получены не все части", "missing": missing[:100]})
+
+    path, size, sha256 = await finalize_session_file(session_id, upload.filename)
+    try:
+        await db.delete(upload)
+        new_doc = await create_document(db, user, path, upload.filename, size, sha256, upload.responsible_id,
+                                        upload.doc_type_id, upload.file_number, upload.permanent, upload.valid_until)
+    except BaseException:
+        # Документ не создан, сессия откатилась: файл возвращается в неё, и finalize можно повторить.
+        # Если не прошёл сам коммит, файл уже в хранилище: в сессию возвращается копия, а файл хранилища
+        # без записи в blobs подберёт core.file_gc
+        await asyncio.to_thread(restore_session_file, session_id, path, blob_path(sha256))
+        raise
+
+    return {"message": "Документ загружен и маршрут применён", "id": new_doc.id, "size": size, "sha256": sha256}
+
+
+@router.delete("/{session_id}")
+async def abort_upload_session(
+        session_id: str,
+        db: AsyncSession = Depends(get_async_session),
+        user: User = Depends(get_current_user),
+):
+    """Отмена загрузки и удаление полученных частей."""
+    upload = await _get_own_session(db, session_id, user)
+    await db.execute(delete(UploadSession).where(UploadSession.id == upload.id))
+    await db.commit()
+    await asyncio.to_thread(remove_session_file, session_id)
+    action_logger.info(f"Пользователь {user.id} отменил загрузку {session_id}")
+    return {"status": "deleted"}
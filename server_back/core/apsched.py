@@ -1,10 +1,18 @@
+import asyncio
 import datetime
+import gzip
 import logging
 import os
+import re
 import subprocess
 from pathlib import Path
 
+from sqlalchemy import delete, text
+
 from core import config
+from core.db import engine, session_factory
+from core.models.models import UploadSession
+from core.utils import remove_session_file, notification_retention_cutoff
 
 BACKUP_DIR = './backups'
 KEEP_DAYS = 7
@@ -56,3 +64,129 @@ def cleanup_old_backups():
             if (now - file_time).days >= KEEP_DAYS:
                 os.remove(path)
                 actions_logger.info(f"[{now}] Old backup deleted: {path}")
+
+
+async def cleanup_upload_sessions():
+    """Удаление истёкших сессий загрузки по частям вместе с их файлами."""
+    async with session_factory() as session:
+        result = await session.execute(
+            delete(UploadSession)
+            .where(UploadSession.expires_at < datetime.datetime.utcnow())
+            .returning(UploadSession.id)
+        )
+        expired = result.scalars().all()
+        await session.commit()
+
+    for session_id in expired:
+        try:
+            remove_session_file(session_id)
+        except OSError as e:
+            errors_logger.error(f"Не удалось удалить файл сессии загрузки {session_id}: {e}")
+    if expired:
+        actions_logger.info(f"Удалено истёкших сессий загрузки: {len(expired)}")
+
+
+PARTITION_NAME_RE = re.compile(r"^notifications_p(\d{4})_(\d{2})$")
+# Ключ pg_advisory_lock: секции обслуживает один воркер, даже если планировщик запущен в каждом
+NOTIFICATION_PARTITIONS_LOCK_KEY = 0x6e6f7466
+
+
+async def _archive_partition(session, partition: str) -> str:
+    """Выгрузка секции в gzip-файл (COPY ... CSV HEADER). Возвращает путь к архиву."""
+    os.makedirs(config.settings.NOTIFICATION_ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(config.settings.NOTIFICATION_ARCHIVE_DIR, f"{partition}.csv.gz")
+    archive = await asyncio.to_thread(gzip.open, path, "wb")
+
+    async def write(data: bytes) -> None:
+        await asyncio.to_thread(archive.write, data)
+
+    try:
+        raw = await (await session.connection()).get_raw_connection()
+        await raw.driver_connection.copy_from_query(
+            f'SELECT * FROM "{partition}" ORDER BY created_at, id', output=write, format="csv", header=True
+        )
+    finally:
+        await asyncio.to_thread(archive.close)
+    return path
+
+
+async def maintain_notification_partitions():
+    """
+    Создаёт секции notifications на следующие месяцы, а секции старше NOTIFICATION_RETENTION_MONTHS
+    выгружает в NOTIFICATION_ARCHIVE_DIR и удаляет. Непрочитанные уведомления удаляемой секции
+    помечаются прочитанными (в архив они попадают непрочитанными, число по пользователям пишется
+    в actions.log) — иначе одно забытое уведомление держало бы секцию вечно, а запросы с условием
+    created_at >= notification_retention_cutoff() его бы уже не показывали.
+    """
+    async with engine.connect() as connection:
+        locked = await connection.scalar(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": NOTIFICATION_PARTITIONS_LOCK_KEY}
+        )
+        await connection.commit()
+        if not locked:
+            return
+        try:
+            await _maintain_notification_partitions()
+        finally:
+            await connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": NOTIFICATION_PARTITIONS_LOCK_KEY})
+            await connection.commit()
+
+
+async def _maintain_notification_partitions():
+    async with session_factory() as session:
+        await session.execute(
+            text("""
+                SELECT notifications_create_partitions(
+                    date_trunc('month', now())::date,
+                    (date_trunc('month', now()) + make_interval(months => :ahead))::date
+                )
+            """),
+            {"ahead": config.settings.NOTIFICATION_PARTITIONS_AHEAD},
+        )
+        await session.commit()
+
+        cutoff = notification_retention_cutoff()
+        result = await session.execute(text("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'notifications'::regclass
+        """))
+        expired = []
+        for (name,) in result:
+            match = PARTITION_NAME_RE.match(name)
+            if match and datetime.datetime(int(match[1]), int(match[2]), 1) < cutoff:
+                expired.append((name, datetime.datetime(int(match[1]), int(match[2]), 1)))
+        await session.commit()
+
+        for partition, month_start in sorted(expired):
+            try:
+                # Запрет записи в секцию до удаления: архив и пометка прочитанными видят одни и те же строки
+                await session.execute(text(f'LOCK TABLE "{partition}" IN SHARE MODE'))
+                path = await _archive_partition(session, partition)
+                # Через notifications, а не секцию: операторные триггеры счётчиков и notification_inbox
+                # заданы на секционированной таблице и срабатывают только для запросов к ней
+                result = await session.execute(text("""
+                    UPDATE notifications SET is_read = true
+                    WHERE created_at >= :month_start AND created_at < :month_start + interval '1 month' AND NOT is_read
+                    RETURNING user_id
+                """), {"month_start": month_start})
+                overdue: dict[int, int] = {}
+                for (user_id,) in result:
+                    overdue[user_id] = overdue.get(user_id, 0) + 1
+                # DROP не вызывает триггеры notifications: строки секции вычитаются из notification_inbox вручную
+                await session.execute(text(f"""
+                    UPDATE notification_inbox i SET total = i.total - d.total
+                    FROM (SELECT user_id, file_id, count(*) AS total FROM "{partition}" GROUP BY user_id, file_id) d
+                    WHERE i.user_id = d.user_id AND i.file_id = d.file_id
+                """))
+                await session.execute(text("DELETE FROM notification_inbox WHERE total <= 0"))
+                await session.execute(text(f'ALTER TABLE notifications DETACH PARTITION "{partition}"'))
+                await session.execute(text(f'DROP TABLE "{partition}"'))
+                await session.commit()
+                if overdue:
+                    actions_logger.info(f"Секция {partition}: {sum(overdue.values())} непрочитанных уведомлений "
+                                        f"старше срока хранения помечены прочитанными, по пользователям: {overdue}")
+                actions_logger.info(f"Секция {partition} выгружена в {path} и удалена")
+            except Exception as e:
+                await session.rollback()
+                errors_logger.error(f"Не удалось архивировать секцию {partition}: {e}")
@@ -1,46 +1,150 @@
+import copy
+import json
 import logging
 import os
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from pathlib import Path
+from typing import Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from core.request_context import request_log_fields
+
 LOGS_DIR = Path("logs")
 os.makedirs(LOGS_DIR, exist_ok=True)
 
 
-def init_logging():
+class RequestContextFilter(logging.Filter):
+    """
+    Дописывает в запись поля текущего запроса. Выполняется в потоке запроса, до очереди: там контекст уже недоступен.
+    Поля, переданные через extra, не перезаписываются.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in request_log_fields().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Кладёт запись в очередь неотформатированной: формат применяют обработчики в потоке журналов.
+    Стандартный prepare форматирует запись сам и обнуляет exc_info и exc_text — JsonFormatter
+    не увидел бы исключения. Здесь трассировка сохраняется в exc_text, а объект трассировки
+    (со ссылками на кадры стека) в очередь не передаётся.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON; поля запроса добавляются, если запись сделана при обработке запроса."""
+
+    REQUEST_FIELDS = ("request_id", "user_id", "route", "elapsed_ms", "status", "duration_ms")
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in self.REQUEST_FIELDS:
+            if hasattr(record, key):
+                entry[key] = getattr(record, key)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Поток записи журналов: обработчики с файловым вводом-выводом и ротацией работают в нём, а не в event loop
+_log_listener: Optional[QueueListener] = None
+
+
+def init_logging(use_queue: bool = True):
+    """
+    Файлы errors.log и actions.log и вывод в консоль. Логгеры только кладут запись в очередь (QueueHandler),
+    запись на диск выполняет QueueListener в отдельном потоке. use_queue=False — обработчики вызываются
+    прямо в потоке запроса (для сравнения в tools.bench_logging).
+    """
+    global _log_listener
+    stop_logging()
+
     # Общий формат
-    formatter = logging.Formatter('[%(asctime)s] [%(levelname)s] [%(name)s] — %(message)s', '%Y-%m-%d %H:%M:%S')
+    if settings.LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('[%(asctime)s] [%(levelname)s] [%(name)s] — %(message)s', '%Y-%m-%d %H:%M:%S')
 
     # 🔴 Логгер ошибок и предупреждений
     error_handler = RotatingFileHandler(f"{LOGS_DIR}/errors.log", maxBytes=1000000, backupCount=3, encoding='utf-8')
     error_handler.setLevel(logging.WARNING)
     error_handler.setFormatter(formatter)
+    error_handler.addFilter(logging.Filter("errors"))
 
     # ✅ Логгер действий (например, создание пользователей)
     actions_handler = RotatingFileHandler(f"{LOGS_DIR}/actions.log", maxBytes=1000000, backupCount=3, encoding='utf-8')
     actions_handler.setLevel(logging.INFO)
     actions_handler.setFormatter(formatter)
+    actions_handler.addFilter(logging.Filter("actions"))
+
+    # (опционально) если хочешь также видеть это всё в консоли
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+
+    handlers = [error_handler, actions_handler, console_handler]
+    if use_queue:
+        # Одна очередь на оба логгера; каждый файловый обработчик пропускает записи только своего логгера
+        log_queue = queue.SimpleQueue()
+        _log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _log_listener.start()
+        queue_handler = ContextQueueHandler(log_queue)
+        queue_handler.addFilter(RequestContextFilter())
+        handlers = [queue_handler]
+    else:
+        for handler in handlers:
+            handler.addFilter(RequestContextFilter())
 
     # 🔥 Логгер ошибок
     error_logger = logging.getLogger("errors")
     error_logger.setLevel(logging.WARNING)
-    error_logger.addHandler(error_handler)
     error_logger.propagate = False
 
     # ✅ Логгер действий
     action_logger = logging.getLogger("actions")
     action_logger.setLevel(logging.INFO)
-    action_logger.addHandler(actions_handler)
     action_logger.propagate = False
 
-    # (опционально) если хочешь также видеть это всё в консоли
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    error_logger.addHandler(console_handler)
-    action_logger.addHandler(console_handler)
+    for logger in (error_logger, action_logger):
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        for handler in handlers:
+            logger.addHandler(handler)
+
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает поток журналов (при завершении приложения)."""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.close()
+        _log_listener = None
 
 
 class Settings(BaseSettings):
@@ -52,6 +156,72 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = os.path.join(BASE_DIR, 'app/uploads')
     STATIC_DIR: str = os.path.join(BASE_DIR, 'app/static')
 
+    # Потоковая загрузка файлов
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # размер буфера записи на диск, байт
+    UPLOAD_MAX_SIZE: int = 4 * 1024 * 1024 * 1024  # максимальный размер одного файла, байт
+
+    # Возобновляемая загрузка по частям
+    UPLOAD_SESSION_CHUNK_SIZE: int = 8 * 1024 * 1024  # размер части по умолчанию, байт
+    UPLOAD_SESSION_MAX_CHUNK_SIZE: int = 64 * 1024 * 1024
+    UPLOAD_SESSION_TTL_HOURS: int = 24  # незавершённая сессия удаляется по истечении срока
+    UPLOAD_SESSION_MAX_ACTIVE: int = 5  # активных сессий на пользователя
+    UPLOAD_SESSION_MAX_PENDING_BYTES: int = 20 * 1024 * 1024 * 1024  # суммарный объём незавершённых загрузок пользователя
+    UPLOAD_SESSION_MAX_PARALLEL_WRITES: int = 8  # одновременных записей частей в одном воркере
+
+    # Отдача файлов через обратный прокси: "" — приложение отдаёт файл само,
+    # "nginx" — заголовок X-Accel-Redirect, "sendfile" — X-Sendfile (Apache, lighttpd)
+    DOWNLOAD_OFFLOAD: str = ""
+    DOWNLOAD_OFFLOAD_LOCATION: str = "/protected-uploads/"  # internal-location nginx, указывающий на UPLOAD_DIR
+
+    # Уведомления хранятся помесячными секциями; секции старше срока хранения выгружаются в архив и удаляются
+    NOTIFICATION_RETENTION_MONTHS: int = 12
+    NOTIFICATION_PARTITIONS_AHEAD: int = 2  # на сколько месяцев вперёд создавать секции
+    NOTIFICATION_ARCHIVE_DIR: str = os.path.join(BASE_DIR, 'archive/notifications')
+
+    # Кэш пользователей для авторизации: запись по (id, iat токена) живёт не дольше TTL
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 300
+
+    # bcrypt выполняется в отдельном пуле потоков; при переполнении очереди запросы получают 429
+    PASSWORD_HASH_WORKERS: int = max(1, (os.cpu_count() or 2) // 2)
+    PASSWORD_HASH_MAX_QUEUE: int = 32  # ожидающих хэширования сверх занятых потоков
+
+    # Массовый импорт пользователей
+    USER_IMPORT_MAX_ROWS: int = 10000
+    USER_IMPORT_HASH_WORKERS: int = os.cpu_count() or 2  # потоков bcrypt на время импорта
+
+    # Пул соединений SQLAlchemy (на каждый воркер)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30  # ожидание свободного соединения, с; дальше — ошибка
+    DB_POOL_RECYCLE: int = 1800  # соединения старше, с, переоткрываются
+    DB_POOL_PRE_PING: bool = True
+    # Кэши подготовленных запросов: asyncpg и адаптера SQLAlchemy. За pgbouncer в режиме transaction — 0
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 100
+
+    # Реплика для чтения (хост[:порт], те же база и учётные данные); пусто — только основная БД
+    PS_REPLICA_HOST: str = ""
+    READ_YOUR_WRITES_SECONDS: int = 10  # после своего изменения пользователь читает из основной БД
+
+    # Задания обслуживания БД (core.maintenance): удаление пачками в отдельных транзакциях
+    MAINTENANCE_BATCH_SIZE: int = 1000
+    MAINTENANCE_MAX_BATCHES: int = 1000  # за один запуск задания
+    MAINTENANCE_BATCH_PAUSE_SECONDS: float = 0.1
+    MAINTENANCE_LOCK_TIMEOUT_MS: int = 5000
+
+    # Сборка мусора в UPLOAD_DIR: файлы без ссылки из БД старше срока ожидания переносятся в карантин,
+    # из карантина удаляются через FILE_GC_QUARANTINE_DAYS
+    FILE_GC_GRACE_HOURS: int = 24
+    FILE_GC_QUARANTINE_DAYS: int = 7
+    FILE_GC_BATCH_SIZE: int = 500  # путей в одном запросе к БД
+    FILE_GC_MAX_ENTRIES_PER_SECOND: int = 2000  # ограничение скорости обхода, записей каталогов в секунду
+
+    # Формат журналов: "text" — строки [время] [уровень] [логгер] — сообщение,
+    # "json" — JSON с полями запроса request_id, user_id, route, elapsed_ms;
+    # итоговая запись о запросе дополнительно содержит status и duration_ms
+    LOG_FORMAT: str = "text"
+
     PS_DATABASE_NAME: str
     PS_DRIVER: str
     PS_USERNAME: str
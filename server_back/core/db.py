@@ -1,8 +1,17 @@
+import json
 import logging
-from sqlalchemy import MetaData
+import time
+from collections import deque
+from typing import Optional
+
+from sqlalchemy import MetaData, Select, text, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+from starlette.requests import Request
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from core import config
+from core.utils import percentiles_ms
 
 metadata_obj = MetaData()
 
@@ -13,12 +22,93 @@ database_password = config.settings.PS_PASSWORD
 database_host = config.settings.PS_HOST
 database_dbname = config.settings.PS_TABLE_NAME
 
-engine = create_async_engine(
-    f"{database_name}+{database_driver}://{database_username}:{database_password}@{database_host}/{database_dbname}",
-    echo=False)
 
+class PoolMetrics:
+    """Счётчики пула соединений воркера: из событий пула и замеров ожидания свободного соединения."""
+
+    def __init__(self):
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.waits = deque(maxlen=1000)  # ожидание соединения, с
+
+    def snapshot(self, pool) -> dict:
+        return {
+            "pool_size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+            "wait_ms": percentiles_ms(self.waits),
+        }
+
+
+class MeasuredQueuePool(AsyncAdaptedQueuePool):
+    # У пула нет события «начало ожидания», поэтому время до выдачи соединения меряем здесь
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.waits.append(time.perf_counter() - started)
+
+
+def _create_engine(host: str, metrics: PoolMetrics) -> AsyncEngine:
+    pool_class = type("MeasuredQueuePool", (MeasuredQueuePool,), {"metrics": metrics})
+    created = create_async_engine(
+        f"{database_name}+{database_driver}://{database_username}:{database_password}@{host}/{database_dbname}",
+        echo=False,
+        poolclass=pool_class,
+        pool_size=config.settings.DB_POOL_SIZE,
+        max_overflow=config.settings.DB_MAX_OVERFLOW,
+        pool_timeout=config.settings.DB_POOL_TIMEOUT,
+        pool_recycle=config.settings.DB_POOL_RECYCLE,
+        pool_pre_ping=config.settings.DB_POOL_PRE_PING,
+        connect_args={
+            "statement_cache_size": config.settings.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": config.settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+        })
+
+    @event.listens_for(created.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        metrics.connects += 1
+
+    @event.listens_for(created.sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.checkouts += 1
+
+    @event.listens_for(created.sync_engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.invalidations += 1
+
+    return created
+
+
+pool_metrics = PoolMetrics()
+engine = _create_engine(database_host, pool_metrics)
 session_factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+# Реплика для чтения: без PS_REPLICA_HOST все запросы идут в основную БД
+replica_pool_metrics = PoolMetrics()
+replica_engine = _create_engine(config.settings.PS_REPLICA_HOST, replica_pool_metrics) \
+    if config.settings.PS_REPLICA_HOST else None
+replica_session_factory = async_sessionmaker(replica_engine, expire_on_commit=False, class_=AsyncSession) \
+    if replica_engine is not None else None
+
+# Cookie с моментом, до которого чтения пользователя идут в основную БД после его собственных изменений
+READ_YOUR_WRITES_COOKIE = "primary_until"
+_UNSAFE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
 
 class Base(DeclarativeBase):
     ...
@@ -29,6 +119,47 @@ async def get_async_session() -> AsyncSession:
         yield session
 
 
+def _reads_from_primary(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+async def get_read_session(request: Request) -> AsyncSession:
+    """
+    Сессия для эндпоинтов только на чтение: реплика, если она настроена.
+    В течение READ_YOUR_WRITES_SECONDS после собственного изменения пользователь читает из основной БД,
+    чтобы не увидеть данные до своей записи из-за отставания реплики.
+    """
+    factory = session_factory if replica_session_factory is None or _reads_from_primary(request) \
+        else replica_session_factory
+    async with factory() as session:
+        yield session
+
+
+class ReadYourWritesMiddleware:
+    """Ставит cookie READ_YOUR_WRITES_COOKIE после успешного изменяющего запроса (POST/PUT/PATCH/DELETE)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in _UNSAFE_METHODS or replica_engine is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                window = config.settings.READ_YOUR_WRITES_SECONDS
+                cookie = (f"{READ_YOUR_WRITES_COOKIE}={time.time() + window:.0f}; Max-Age={window}; "
+                          f"Path=/; HttpOnly; SameSite=lax")
+                message["headers"] = [*message.get("headers", []), (b"set-cookie", cookie.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
 def connection(method):
     async def wrapper(*args, **kwargs):
         async with session_factory() as session:
@@ -42,3 +173,22 @@ def connection(method):
                 await session.close()
 
     return wrapper
+
+
+async def estimate_count(session: AsyncSession, query: Optional[Select] = None, table: Optional[str] = None) -> int:
+    """
+    Приблизительное число строк без полного подсчёта:
+    по статистике pg_class для всей таблицы или по оценке планировщика для запроса с фильтрами.
+    """
+    if query is None:
+        result = await session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+        )
+        return max(result.scalar() or 0, 0)
+
+    compiled = query.compile(dialect=session.bind.dialect, compile_kwargs={"literal_binds": True})
+    result = await session.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}"))
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
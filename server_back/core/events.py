@@ -0,0 +1,251 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Optional
+
+import asyncpg
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.db import engine, session_factory
+from core.models.models import Notification
+from core.security import principal_cache
+
+error_logger = logging.getLogger("errors")
+action_logger = logging.getLogger("actions")
+
+# Сколько событий может ждать отправки одному клиенту; при переполнении клиент получает resync
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Канал NOTIFY, через который воркеры обмениваются событиями уведомлений
+CHANNEL = "notification_events"
+# Полезная нагрузка NOTIFY ограничена 8000 байт; события режутся на пачки меньше этого
+MAX_PAYLOAD_SIZE = 7000
+# Одно событие read должно помещаться в NOTIFY целиком
+READ_EVENT_MAX_IDS = 500
+LISTENER_KEEPALIVE_SECONDS = 30
+LISTENER_MAX_RECONNECT_DELAY = 30
+
+
+class NotificationHub:
+    """
+    Подписки WebSocket-клиентов этого процесса на события уведомлений пользователя.
+    Событие — словарь с полем type: notification (новое уведомление), read (прочитаны id), resync.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[int, set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+
+    def publish(self, user_id: int, event: dict) -> None:
+        for queue in self._subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Клиент не успевает читать: отбрасываем накопленное, он перечитает список сам
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+                error_logger.error(f"Очередь событий пользователя {user_id} переполнена, отправлен resync")
+
+    def user_ids(self) -> list[int]:
+        return list(self._subscribers)
+
+    def resync_all(self) -> None:
+        for user_id in list(self._subscribers):
+            self.publish(user_id, {"type": "resync"})
+
+
+def notification_to_dict(n) -> dict:
+    return {
+        "id": n.id,
+        "file_id": n.file_id,
+        "message": n.message,
+        "created_at": n.created_at.isoformat(),
+        "is_read": n.is_read,
+    }
+
+
+hub = NotificationHub()
+
+
+# Полезная нагрузка: {"events": [[user_id, событие], ...]}, {"file_id": id} —
+# уведомления о новом документе, которые каждый воркер сам читает из БД для своих подписчиков,
+# или {"principal": user_id | null} — сброс кэша авторизации по пользователю или целиком
+def _payloads(events: list[tuple[int, dict]]):
+    batch, size = [], 16
+    for user_id, event in events:
+        item = json.dumps([user_id, event], ensure_ascii=False)
+        item_size = len(item.encode()) + 1
+        if item_size > MAX_PAYLOAD_SIZE:
+            # Событие само не помещается в NOTIFY: клиент получит resync и перечитает список из БД
+            item = json.dumps([user_id, {"type": "resync"}])
+            item_size = len(item) + 1
+        if batch and size + item_size > MAX_PAYLOAD_SIZE:
+            yield '{"events": [' + ",".join(batch) + "]}"
+            batch, size = [], 16
+        batch.append(item)
+        size += item_size
+    if batch:
+        yield '{"events": [' + ",".join(batch) + "]}"
+
+
+async def _pg_notify(db: AsyncSession, payload: str) -> None:
+    # pg_notify в транзакции доставляется слушателям только после COMMIT и не доставляется при откате
+    await db.execute(select(func.pg_notify(CHANNEL, payload)))
+
+
+async def _notify(db: AsyncSession, events: list[tuple[int, dict]]) -> None:
+    for payload in _payloads(events):
+        await _pg_notify(db, payload)
+
+
+async def notify_notifications(db: AsyncSession, notifications) -> None:
+    """Событие о новых уведомлениях. Вызывается до commit в той же транзакции."""
+    await db.flush()
+    await _notify(db, [
+        (n.user_id, {"type": "notification", "notification": notification_to_dict(n)})
+        for n in notifications
+    ])
+
+
+async def notify_document(db: AsyncSession, file_id: int) -> None:
+    """
+    Событие о всех уведомлениях по документу. Одно сообщение независимо от числа получателей:
+    при рассылке на тысячи человек события по каждому не помещаются в NOTIFY.
+    """
+    await _pg_notify(db, json.dumps({"file_id": file_id}))
+
+
+async def _publish_document(file_id: int) -> None:
+    # Один запрос на воркер и только по пользователям, подключённым к этому воркеру
+    user_ids = hub.user_ids()
+    if not user_ids:
+        return
+    try:
+        async with session_factory() as session:
+            result = await session.execute(
+                select(Notification).where(Notification.file_id == file_id, Notification.user_id.in_(user_ids))
+            )
+            notifications = result.scalars().all()
+    except Exception as e:
+        error_logger.error(f"Не удалось разослать уведомления по документу {file_id}: {e}")
+        return
+    for n in notifications:
+        hub.publish(n.user_id, {"type": "notification", "notification": notification_to_dict(n)})
+
+
+async def notify_read(db: AsyncSession, user_id: int, notification_ids: list[int]) -> None:
+    """Событие о прочтении уведомлений. Вызывается до commit в той же транзакции."""
+    await _notify(db, [
+        (user_id, {"type": "read", "ids": notification_ids[i:i + READ_EVENT_MAX_IDS]})
+        for i in range(0, len(notification_ids), READ_EVENT_MAX_IDS)
+    ])
+
+
+async def notify_principal_changed(db: AsyncSession, user_id: Optional[int] = None) -> None:
+    """
+    Сброс кэша авторизации во всех воркерах после изменения пользователя (None — всех пользователей).
+    Вызывается до commit в той же транзакции; свой воркер вызывающий сбрасывает сам после commit.
+    """
+    await _pg_notify(db, json.dumps({"principal": user_id}))
+
+
+def _invalidate_principal(user_id: Optional[int]) -> None:
+    if user_id is None:
+        principal_cache.clear()
+    else:
+        principal_cache.invalidate(user_id)
+
+
+class NotificationListener:
+    """
+    Одно выделенное соединение LISTEN на воркер: события из всех процессов раздаются
+    локальным подпискам hub, сбросы кэша авторизации применяются к principal_cache.
+    После обрыва соединение восстанавливается, клиенты получают resync, а кэш очищается,
+    потому что события за время обрыва потеряны.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._pending: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+            if "principal" in message:
+                _invalidate_principal(message["principal"])
+                return
+            if "file_id" in message:
+                task = asyncio.create_task(_publish_document(message["file_id"]))
+                self._pending.add(task)
+                task.add_done_callback(self._pending.discard)
+                return
+            for user_id, event in message["events"]:
+                hub.publish(user_id, event)
+        except (ValueError, TypeError, KeyError) as e:
+            error_logger.error(f"Некорректное событие в канале {channel}: {e}")
+
+    async def _run(self) -> None:
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        delay = 1
+        reconnecting = False
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _: lost.set())
+                await connection.add_listener(CHANNEL, self._on_notify)
+                if reconnecting:
+                    action_logger.info("Соединение LISTEN восстановлено")
+                # Подключившиеся раньше клиенты могли пропустить события, а кэш — сбросы
+                hub.resync_all()
+                principal_cache.clear()
+                delay = 1
+                reconnecting = True
+
+                # Обрыв сети без закрытия сокета termination listener не заметит — проверяем запросом
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), LISTENER_KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        await asyncio.wait_for(connection.execute("SELECT 1"), LISTENER_KEEPALIVE_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error_logger.error(f"Соединение LISTEN {CHANNEL} потеряно: {e}")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    connection.terminate()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, LISTENER_MAX_RECONNECT_DELAY)
+
+
+listener = NotificationListener()
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Iterator, Optional
+
+from sqlalchemy import select, text, any_
+
+from core.config import settings
+from core.db import engine, session_factory
+from core.models.models import Blob, Document
+from core.storage import CAS_DIR
+from core.utils import UPLOAD_DIR
+
+# Файлы без ссылки из БД сначала переносятся сюда с сохранением относительного пути и удаляются
+# только через FILE_GC_QUARANTINE_DAYS: ошибочно собранный файл можно вернуть на место
+QUARANTINE_DIR = os.path.join(UPLOAD_DIR, ".quarantine")
+SAMPLE_SIZE = 20
+# Ключ pg_advisory_lock: сборку выполняет один воркер, даже если планировщик запущен в каждом
+FILE_GC_LOCK_KEY = 0x66696c65
+
+errors_logger = logging.getLogger("errors")
+actions_logger = logging.getLogger("actions")
+
+
+def _scan(root: str, cutoff: float, batch_size: int) -> Iterator[tuple[list[tuple[str, int]], int]]:
+    """
+    Потоковый обход дерева через os.scandir: полный список файлов не строится.
+    Отдаёт пачки (файлы с mtime раньше cutoff в виде (путь, размер), число просмотренных записей).
+    Служебные каталоги с точкой в начале имени (.sessions, .quarantine) не обходятся.
+    """
+    stack = [root]
+    candidates, scanned = [], 0
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    scanned += 1
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        if stat.st_mtime < cutoff:
+                            candidates.append((entry.path, stat.st_size))
+                    if scanned >= batch_size or len(candidates) >= batch_size:
+                        yield candidates, scanned
+                        candidates, scanned = [], 0
+        except FileNotFoundError:
+            # Каталог удалён во время обхода
+            continue
+    if candidates or scanned:
+        yield candidates, scanned
+
+
+async def _iter_batches(root: str, cutoff: float):
+    """Пачки _scan с обходом вне event loop и ограничением FILE_GC_MAX_ENTRIES_PER_SECOND."""
+    if not os.path.isdir(root):
+        return
+    batches = _scan(root, cutoff, settings.FILE_GC_BATCH_SIZE)
+    started, total = time.monotonic(), 0
+    while True:
+        batch = await asyncio.to_thread(next, batches, None)
+        if batch is None:
+            return
+        candidates, scanned = batch
+        yield candidates
+        total += scanned
+        # Обход не должен забирать весь диск у скачиваний: выравниваем скорость до заданной
+        delay = total / settings.FILE_GC_MAX_ENTRIES_PER_SECOND - (time.monotonic() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def _referenced(paths: list[str]) -> set[str]:
+    """Пути из пачки, на которые ссылается документ или запись хранилища blobs (по одному запросу на пачку)."""
+    if not paths:
+        return set()
+    cas_prefix = CAS_DIR + os.sep
+    digests = {os.path.basename(path): path for path in paths if path.startswith(cas_prefix)}
+    async with session_factory() as session:
+        result = await session.execute(select(Document.file_path).where(Document.file_path == any_(paths)))
+        referenced = set(result.scalars())
+        if digests:
+            result = await session.execute(select(Blob.digest).where(Blob.digest == any_(list(digests))))
+            referenced.update(digests[digest] for digest in result.scalars())
+    return referenced
+
+
+def _quarantine_file(path: str, cutoff: float) -> bool:
+    # Файл мог быть перезаписан после проверки (например, то же содержимое загрузили заново) — не трогаем
+    try:
+        if os.stat(path).st_mtime >= cutoff:
+            return False
+    except FileNotFoundError:
+        return False
+    target = os.path.join(QUARANTINE_DIR, os.path.relpath(path, UPLOAD_DIR))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(path, target)
+    # mtime — момент переноса в карантин: от него отсчитывается срок до удаления
+    os.utime(target)
+    return True
+
+
+def _prune_quarantine_dirs(directory: str) -> None:
+    # Пустые каталоги карантина удаляются вплоть до самого QUARANTINE_DIR (не включая его).
+    # В UPLOAD_DIR каталоги не удаляются: в них параллельно может писать загрузка
+    while os.path.abspath(directory) != os.path.abspath(QUARANTINE_DIR):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+
+
+def _restore_file(path: str, original: str) -> bool:
+    if os.path.exists(original):
+        return False
+    os.makedirs(os.path.dirname(original), exist_ok=True)
+    os.replace(path, original)
+    _prune_quarantine_dirs(os.path.dirname(path))
+    return True
+
+
+def _purge_file(path: str) -> None:
+    os.remove(path)
+    _prune_quarantine_dirs(os.path.dirname(path))
+
+
+def _new_report(stage: str) -> dict:
+    return {"stage": stage, "candidates": 0, "files": 0, "bytes": 0, "restored": 0, "errors": 0, "sample": []}
+
+
+async def quarantine_orphan_files(dry_run: bool = False) -> dict:
+    """
+    Переносит в карантин файлы UPLOAD_DIR старше FILE_GC_GRACE_HOURS, на которые нет ссылки
+    из documents.file_path или blobs. Срок ожидания защищает загрузки, ещё не записанные в БД.
+    dry_run — только отчёт, файлы не перемещаются.
+    """
+    cutoff = time.time() - settings.FILE_GC_GRACE_HOURS * 3600
+    report = _new_report("quarantine")
+    async for candidates in _iter_batches(UPLOAD_DIR, cutoff):
+        referenced = await _referenced([path for path, _ in candidates])
+        report["candidates"] += len(candidates)
+        for path, size in candidates:
+            if path in referenced:
+                continue
+            if not dry_run:
+                try:
+                    if not await asyncio.to_thread(_quarantine_file, path, cutoff):
+                        continue
+                except OSError as e:
+                    report["errors"] += 1
+                    errors_logger.error(f"Не удалось перенести в карантин {path}: {e}")
+                    continue
+            report["files"] += 1
+            report["bytes"] += size
+            if len(report["sample"]) < SAMPLE_SIZE:
+                report["sample"].append(path)
+    return report
+
+
+async def purge_quarantine(dry_run: bool = False) -> dict:
+    """
+    Удаляет файлы, пролежавшие в карантине FILE_GC_QUARANTINE_DAYS. Перед удалением ссылки проверяются
+    ещё раз: файл, на который за это время сослался документ, возвращается на исходное место.
+    """
+    cutoff = time.time() - settings.FILE_GC_QUARANTINE_DAYS * 86400
+    report = _new_report("purge")
+    async for candidates in _iter_batches(QUARANTINE_DIR, cutoff):
+        originals = {path: os.path.join(UPLOAD_DIR, os.path.relpath(path, QUARANTINE_DIR)) for path, _ in candidates}
+        referenced = await _referenced(list(originals.values()))
+        report["candidates"] += len(candidates)
+        for path, size in candidates:
+            original = originals[path]
+            try:
+                if original in referenced:
+                    if not dry_run and await asyncio.to_thread(_restore_file, path, original):
+                        errors_logger.error(f"Файл {original} был в карантине, но на него есть ссылка — возвращён")
+                        report["restored"] += 1
+                    continue
+                if not dry_run:
+                    await asyncio.to_thread(_purge_file, path)
+            except OSError as e:
+                report["errors"] += 1
+                errors_logger.error(f"Не удалось удалить из карантина {path}: {e}")
+                continue
+            report["files"] += 1
+            report["bytes"] += size
+            if len(report["sample"]) < SAMPLE_SIZE:
+                report["sample"].append(original)
+    return report
+
+
+async def collect_orphan_files(dry_run: bool = False) -> Optional[dict]:
+    """
+    Сборка мусора в UPLOAD_DIR: удаление просроченного карантина, затем перенос в карантин новых файлов без ссылок.
+    Возвращает отчёт обоих этапов или None, если сборка уже выполняется в другом воркере.
+    """
+    started = time.monotonic()
+    async with engine.connect() as connection:
+        # Отчёт ничего не меняет, ему блокировка не нужна
+        if not dry_run:
+            locked = await connection.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": FILE_GC_LOCK_KEY})
+            await connection.commit()
+            if not locked:
+                return None
+        try:
+            purged = await purge_quarantine(dry_run)
+            quarantined = await quarantine_orphan_files(dry_run)
+        finally:
+            if not dry_run:
+                await connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": FILE_GC_LOCK_KEY})
+                await connection.commit()
+
+    report = {"dry_run": dry_run, "seconds": round(time.monotonic() - started, 1),
+              "purge": purged, "quarantine": quarantined}
+    if not dry_run:
+        actions_logger.info(
+            f"Сборка мусора файлов: в карантин {quarantined['files']} ({quarantined['bytes']} байт), "
+            f"удалено из карантина {purged['files']} ({purged['bytes']} байт), возвращено {purged['restored']}"
+        )
+    return report
+
+
+async def run_file_gc() -> None:
+    """Для APScheduler."""
+    try:
+        await collect_orphan_files()
+    except Exception as e:
+        errors_logger.error(f"Сборка мусора файлов завершилась ошибкой: {e}")
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from core.config import LOGS_DIR
+
+# Журналы, доступные админам; RotatingFileHandler переименовывает их в .1, .2, ... (чем больше номер, тем старше)
+LOG_FILES = {
+    "actions": LOGS_DIR / "actions.log",
+    "errors": LOGS_DIR / "errors.log",
+}
+BLOCK_SIZE = 64 * 1024
+MAX_LINES = 5000
+STREAM_POLL_SECONDS = 1.0
+STREAM_HEARTBEAT_SECONDS = 15.0
+
+
+def _log_chain(path: Path) -> list[Path]:
+    """Текущий файл журнала и его ротированные копии, от новых к старым."""
+    chain = [path]
+    index = 1
+    while (rotated := path.with_name(f"{path.name}.{index}")).exists():
+        chain.append(rotated)
+        index += 1
+    return chain
+
+
+def _read_lines_before(path: Path, offset: int, count: int) -> tuple[list[bytes], int]:
+    """
+    Чтение с конца блоками по BLOCK_SIZE: до count последних строк, заканчивающихся до смещения offset.
+    Возвращает строки (от старых к новым) и смещение начала первой из них.
+    """
+    with path.open("rb") as file:
+        position, buffer = offset, b""
+        # На count строк нужно count + 1 переводов строки: первая строка блока может быть неполной
+        while position > 0 and buffer.count(b"\n") <= count:
+            size = min(BLOCK_SIZE, position)
+            position -= size
+            file.seek(position)
+            buffer = file.read(size) + buffer
+
+    ends_with_newline = buffer.endswith(b"\n")
+    lines = (buffer[:-1] if ends_with_newline else buffer).split(b"\n") if buffer else []
+    if position > 0:
+        lines = lines[1:]
+    lines = lines[-count:] if count else []
+    tail = b"\n".join(lines) + (b"\n" if ends_with_newline and lines else b"")
+    return lines, offset - len(tail)
+
+
+def encode_log_cursor(inode: int, offset: int) -> str:
+    return f"{inode}-{offset}"
+
+
+def decode_log_cursor(cursor: str) -> tuple[int, int]:
+    inode, offset = cursor.split("-")
+    return int(inode), int(offset)
+
+
+def read_log_page(path: Path, count: int, before: Optional[str] = None) -> tuple[list[str], Optional[str]]:
+    """
+    Страница журнала из count строк перед курсором (без курсора — последние строки) с переходом
+    в ротированные файлы. Курсор — номер inode файла и смещение: при ротации файл переименовывается,
+    inode сохраняется, поэтому курсор остаётся верным. Возвращает строки от старых к новым
+    и курсор следующей (более старой) страницы или None, если старше ничего нет.
+    """
+    chain = _log_chain(path)
+    stats = []
+    for file_path in chain:
+        try:
+            stats.append((file_path, file_path.stat()))
+        except FileNotFoundError:
+            continue
+
+    if before is None:
+        index, offset = 0, stats[0][1].st_size if stats else 0
+    else:
+        inode, offset = decode_log_cursor(before)
+        index = next((i for i, (_, stat) in enumerate(stats) if stat.st_ino == inode), None)
+        if index is None:
+            # Файл уже удалён ротацией
+            return [], None
+
+    collected: list[bytes] = []
+    while index < len(stats):
+        file_path, stat = stats[index]
+        lines, offset = _read_lines_before(file_path, min(offset, stat.st_size), count - len(collected))
+        collected = lines + collected
+        if len(collected) >= count:
+            break
+        index += 1
+        if index < len(stats):
+            offset = stats[index][1].st_size
+
+    if index >= len(stats) or (offset == 0 and index == len(stats) - 1):
+        next_cursor = None
+    elif offset == 0:
+        next_cursor = encode_log_cursor(stats[index + 1][1].st_ino, stats[index + 1][1].st_size)
+    else:
+        next_cursor = encode_log_cursor(stats[index][1].st_ino, offset)
+    return [line.decode("utf-8", errors="replace") for line in collected], next_cursor
+
+
+def _open_at(path: Path, cursor: Optional[str] = None):
+    """Открывает журнал для слежения: с позиции курсора, если файл тот же, иначе с конца."""
+    file = path.open("rb")
+    stat = os.fstat(file.fileno())
+    position = stat.st_size
+    if cursor:
+        inode, offset = decode_log_cursor(cursor)
+        if inode == stat.st_ino and offset <= stat.st_size:
+            position = offset
+    file.seek(position)
+    return file, stat.st_ino
+
+
+def _open_next(path: Path, inode: int):
+    """
+    Следующий по времени файл после дочитанного: тот, что занял его место при ротации.
+    Если между опросами ротаций было несколько, он уже сам может быть переименован в .1, .2, ...
+    """
+    chain = _log_chain(path)
+    inodes = []
+    for file_path in chain:
+        try:
+            inodes.append(file_path.stat().st_ino)
+        except FileNotFoundError:
+            inodes.append(None)
+    index = inodes.index(inode) if inode in inodes else len(chain)
+    next_path = chain[max(index - 1, 0)]
+    file = next_path.open("rb")
+    return file, os.fstat(file.fileno()).st_ino
+
+
+def _rotated(path: Path, inode: int, position: int) -> bool:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return False
+    return stat.st_ino != inode or stat.st_size < position
+
+
+async def follow_log(path: Path, is_disconnected, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Server-Sent Events с новыми строками журнала. Файл не перечитывается: держится открытым
+    и читается с последней позиции; после ротации дочитывается старый файл и открывается новый.
+    id события — курсор после отданных строк: браузер передаёт его в Last-Event-ID при переподключении,
+    и поток продолжается без пропусков.
+    """
+    file, inode = await asyncio.to_thread(_open_at, path, last_event_id)
+    pending = b""
+    last_sent = time.monotonic()
+    draining = False
+    try:
+        while not await is_disconnected():
+            data = await asyncio.to_thread(file.read, BLOCK_SIZE)
+            if data:
+                pending += data
+                complete, _, pending = pending.rpartition(b"\n")
+                if complete:
+                    position = file.tell() - len(pending)
+                    lines = complete.decode("utf-8", errors="replace").split("\n")
+                    yield (f"id: {encode_log_cursor(inode, position)}\n"
+                           + "".join(f"data: {line}\n" for line in lines) + "\n")
+                    last_sent = time.monotonic()
+                    continue
+            elif await asyncio.to_thread(_rotated, path, inode, file.tell()):
+                # Запись могла попасть в старый файл между чтением и проверкой: перед переходом
+                # он дочитывается ещё раз, после переименования в него уже никто не пишет
+                if not draining:
+                    draining = True
+                    continue
+                await asyncio.to_thread(file.close)
+                # Новый файл после ротации читается с начала
+                file, inode = await asyncio.to_thread(_open_next, path, inode)
+                pending, draining = b"", False
+                continue
+
+            if time.monotonic() - last_sent >= STREAM_HEARTBEAT_SECONDS:
+                # Комментарий SSE: не даёт прокси закрыть простаивающее соединение
+                yield ": ping\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(STREAM_POLL_SECONDS)
+    finally:
+        await asyncio.to_thread(file.close)
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from core.config import settings
+from core.db import session_factory
+
+errors_logger = logging.getLogger("errors")
+actions_logger = logging.getLogger("actions")
+
+
+# Задание: описание и DELETE ... RETURNING не больше :batch строк (анти-join без выборки строк в приложение).
+# Оно повторяется, пока удаляет полную пачку; каждая пачка — отдельная короткая транзакция,
+# поэтому блокировки строк держатся доли секунды, а между пачками проходят запросы приложения.
+# Строки перебираются по id начиная после :after_id — последнего удалённого: следующая пачка
+# не просматривает заново уже проверенную часть таблицы
+JOBS = {
+    "orphan_responsibles": (
+        "Ответственные с несуществующим пользователем или службой",
+        """
+        DELETE FROM responsibles WHERE id IN (
+            SELECT r.id FROM responsibles r
+            WHERE r.id > :after_id
+              AND (NOT EXISTS (SELECT 1 FROM users u WHERE u.id = r.user_id)
+                   OR NOT EXISTS (SELECT 1 FROM departments d WHERE d.id = r.department_id))
+            ORDER BY r.id
+            LIMIT :batch
+        )
+        RETURNING id, user_id, department_id
+        """,
+    ),
+    "duplicate_responsibles": (
+        "Повторные назначения пользователя ответственным за одну службу (остаётся самое раннее)",
+        """
+        DELETE FROM responsibles WHERE id IN (
+            SELECT r.id FROM responsibles r
+            WHERE r.id > :after_id
+              AND EXISTS (
+                  SELECT 1 FROM responsibles e
+                  WHERE e.user_id = r.user_id AND e.department_id = r.department_id AND e.id < r.id
+              )
+            ORDER BY r.id
+            LIMIT :batch
+        )
+        RETURNING id, user_id, department_id
+        """,
+    ),
+    "orphan_notifications": (
+        "Уведомления о несуществующих документах или несуществующим пользователям",
+        """
+        DELETE FROM notifications WHERE (id, created_at) IN (
+            SELECT n.id, n.created_at FROM notifications n
+            WHERE n.id > :after_id
+              AND (NOT EXISTS (SELECT 1 FROM documents d WHERE d.id = n.file_id)
+                   OR NOT EXISTS (SELECT 1 FROM users u WHERE u.id = n.user_id))
+            ORDER BY n.id
+            LIMIT :batch
+        )
+        RETURNING id, user_id, file_id
+        """,
+    ),
+}
+
+
+# SQLSTATE lock_not_available: истёк lock_timeout (asyncpg LockNotAvailableError)
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def is_lock_timeout(error: Exception) -> bool:
+    """Ошибка БД из-за lock_timeout — таблицу держит другая транзакция, запуск можно повторить позже."""
+    return isinstance(error, DBAPIError) and getattr(error.orig, "sqlstate", None) == LOCK_NOT_AVAILABLE
+
+
+async def run_maintenance_job(name: str, batch_size: Optional[int] = None,
+                              max_batches: Optional[int] = None) -> dict:
+    """Выполняет задание пачками, пока есть что удалять, но не больше max_batches пачек."""
+    _, statement = JOBS[name]
+    batch_size = batch_size or settings.MAINTENANCE_BATCH_SIZE
+    max_batches = max_batches or settings.MAINTENANCE_MAX_BATCHES
+    deleted, batches, sample, after_id = 0, 0, [], 0
+    completed = False
+
+    while batches < max_batches:
+        async with session_factory() as session:
+            # Не ждать чужие длинные блокировки: пачка откатится, задание продолжит в следующий запуск
+            await session.execute(text(f"SET LOCAL lock_timeout = '{settings.MAINTENANCE_LOCK_TIMEOUT_MS}ms'"))
+            result = await session.execute(text(statement), {"batch": batch_size, "after_id": after_id})
+            rows = [dict(row._mapping) for row in result]
+            await session.commit()
+        if rows:
+            after_id = max(row["id"] for row in rows)
+
+        batches += 1
+        deleted += len(rows)
+        sample.extend(rows[:10 - len(sample)])
+        if len(rows) < batch_size:
+            completed = True
+            break
+        await asyncio.sleep(settings.MAINTENANCE_BATCH_PAUSE_SECONDS)
+
+    if deleted:
+        errors_logger.warning(f"Обслуживание {name}: удалено {deleted} строк за {batches} пачек, например {sample}")
+    # completed = False: сработал предел пачек, остаток удалит следующий запуск
+    return {"job": name, "deleted": deleted, "batches": batches, "completed": completed, "sample": sample}
+
+
+async def run_all_maintenance_jobs(batch_size: Optional[int] = None,
+                                   max_batches: Optional[int] = None) -> list[dict]:
+    """
+    Все задания по очереди; ошибка одного (например, lock_timeout) не останавливает остальные
+    и возвращается в его результате. Для APScheduler и POST /api/admin/maintenance/all.
+    """
+    results = []
+    for name in JOBS:
+        try:
+            results.append(await run_maintenance_job(name, batch_size, max_batches))
+        except Exception as e:
+            errors_logger.error(f"Задание обслуживания {name} завершилось ошибкой: {e}")
+            results.append({"job": name, "error": str(e)})
+    actions_logger.info("Обслуживание БД выполнено: " + ", ".join(
+        f"{result['job']}={result.get('deleted', 'ошибка')}" for result in results
+    ))
+    return results
@@ -0,0 +1,167 @@
+"""
+Объекты БД, которые не описываются моделями: расширения, функции и триггеры.
+Один текст на миграции и на Base.metadata.create_all (чистая база при первом запуске).
+Строки — обычный SQL; в DDL() моделей они передаются через models.ddl_statement, экранирующий %.
+"""
+
+TRGM_EXTENSION = "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+
+# Поисковый вектор документа: название и номер (вес A), тип документа (B), служба (C).
+# Переименование типа документа или службы пересчитывает векторы связанных документов
+SEARCH_VECTOR_FUNCTIONS = [
+    """
+    CREATE OR REPLACE FUNCTION documents_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.original_filename, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.file_number, '')), 'A') ||
+            setweight(to_tsvector('russian', coalesce((SELECT name FROM doc_types WHERE id = NEW.doc_type_id), '')), 'B') ||
+            setweight(to_tsvector('russian', coalesce((SELECT name FROM departments WHERE id = NEW.responsible_id), '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION documents_search_vector_refresh() RETURNS trigger AS $$
+    BEGIN
+        IF TG_TABLE_NAME = 'doc_types' THEN
+            UPDATE documents SET doc_type_id = doc_type_id WHERE doc_type_id = NEW.id;
+        ELSE
+            UPDATE documents SET responsible_id = responsible_id WHERE responsible_id = NEW.id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+]
+
+SEARCH_VECTOR_TRIGGERS = [
+    """
+    CREATE TRIGGER documents_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF original_filename, file_number, doc_type_id, responsible_id ON documents
+        FOR EACH ROW EXECUTE FUNCTION documents_search_vector_update()
+    """,
+    """
+    CREATE TRIGGER doc_types_search_vector_trigger
+        AFTER UPDATE OF name ON doc_types
+        FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name) EXECUTE FUNCTION documents_search_vector_refresh()
+    """,
+    """
+    CREATE TRIGGER departments_search_vector_trigger
+        AFTER UPDATE OF name ON departments
+        FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name) EXECUTE FUNCTION documents_search_vector_refresh()
+    """,
+]
+
+# Секции notifications по месяцам: notifications_pГГГГ_ММ и notifications_default для значений вне секций.
+# Следующие месяцы создаёт заранее задание maintain_notification_partitions
+NOTIFICATIONS_CREATE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION notifications_create_partitions(first_month date, last_month date) RETURNS void AS $$
+DECLARE
+    month_start date := date_trunc('month', first_month)::date;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF notifications FOR VALUES FROM (%L) TO (%L)',
+            'notifications_p' || to_char(month_start, 'YYYY_MM'),
+            month_start,
+            (month_start + interval '1 month')::date
+        );
+        month_start := (month_start + interval '1 month')::date;
+    END LOOP;
+END
+$$ LANGUAGE plpgsql
+"""
+
+NOTIFICATIONS_DEFAULT_PARTITION = "CREATE TABLE IF NOT EXISTS notifications_default PARTITION OF notifications DEFAULT"
+
+# Счётчики непрочитанных: операторные триггеры с таблицами переходов — один UPSERT на INSERT ... SELECT
+# с тысячами строк, а не по строке. Пользователи упорядочены, чтобы параллельные рассылки не взаимоблокировались
+NOTIFICATION_COUNTERS_FUNCTION = """
+CREATE OR REPLACE FUNCTION notification_counters_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO notification_counters (user_id, unread)
+        SELECT user_id, count(*) FROM new_rows WHERE NOT is_read GROUP BY user_id ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET unread = notification_counters.unread + EXCLUDED.unread;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE notification_counters c SET unread = c.unread - d.cnt
+        FROM (SELECT user_id, count(*) AS cnt FROM old_rows WHERE NOT is_read GROUP BY user_id) d
+        WHERE c.user_id = d.user_id;
+    ELSE
+        INSERT INTO notification_counters (user_id, unread)
+        SELECT user_id, sum(delta) FROM (
+            SELECT user_id, -1 AS delta FROM old_rows WHERE NOT is_read
+            UNION ALL
+            SELECT user_id, 1 FROM new_rows WHERE NOT is_read
+        ) d
+        GROUP BY user_id HAVING sum(delta) <> 0 ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET unread = notification_counters.unread + EXCLUDED.unread;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+NOTIFICATION_COUNTER_TRIGGERS = [
+    ('notifications_counter_insert', 'INSERT', 'NEW TABLE AS new_rows'),
+    ('notifications_counter_update', 'UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+    ('notifications_counter_delete', 'DELETE', 'OLD TABLE AS old_rows'),
+]
+
+
+# «В работе»: по строке на пару (пользователь, документ) со временем последнего уведомления и числом
+# непрочитанных — страница /api/file/inwork читается по индексу, а не сворачивается из всех уведомлений.
+# total — число уведомлений пары: строка удаляется вместе с последним из них.
+# user_id, file_id и created_at уведомлений не меняются, при UPDATE пересчитываются только непрочитанные
+NOTIFICATION_INBOX_FUNCTION = """
+CREATE OR REPLACE FUNCTION notification_inbox_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO notification_inbox (user_id, file_id, notified_at, unread, total)
+        SELECT user_id, file_id, max(created_at), count(*) FILTER (WHERE NOT is_read), count(*)
+        FROM new_rows GROUP BY user_id, file_id ORDER BY user_id, file_id
+        ON CONFLICT (user_id, file_id) DO UPDATE SET
+            notified_at = greatest(notification_inbox.notified_at, EXCLUDED.notified_at),
+            unread = notification_inbox.unread + EXCLUDED.unread,
+            total = notification_inbox.total + EXCLUDED.total;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE notification_inbox i SET unread = i.unread - d.unread, total = i.total - d.total
+        FROM (
+            SELECT user_id, file_id, count(*) FILTER (WHERE NOT is_read) AS unread, count(*) AS total
+            FROM old_rows GROUP BY user_id, file_id
+        ) d
+        WHERE i.user_id = d.user_id AND i.file_id = d.file_id;
+        DELETE FROM notification_inbox i USING (SELECT DISTINCT user_id, file_id FROM old_rows) d
+        WHERE i.user_id = d.user_id AND i.file_id = d.file_id AND i.total <= 0;
+    ELSE
+        UPDATE notification_inbox i SET unread = i.unread + d.delta
+        FROM (
+            SELECT user_id, file_id, sum(delta) AS delta FROM (
+                SELECT user_id, file_id, -1 AS delta FROM old_rows WHERE NOT is_read
+                UNION ALL
+                SELECT user_id, file_id, 1 FROM new_rows WHERE NOT is_read
+            ) changes
+            GROUP BY user_id, file_id HAVING sum(delta) <> 0
+        ) d
+        WHERE i.user_id = d.user_id AND i.file_id = d.file_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+NOTIFICATION_INBOX_TRIGGERS = [
+    ('notifications_inbox_insert', 'INSERT', 'NEW TABLE AS new_rows'),
+    ('notifications_inbox_update', 'UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+    ('notifications_inbox_delete', 'DELETE', 'OLD TABLE AS old_rows'),
+]
+
+
+def statement_trigger(name: str, operation: str, referencing: str, function: str) -> str:
+    """Операторный AFTER-триггер на notifications с таблицами переходов."""
+    return f"""
+        CREATE OR REPLACE TRIGGER {name}
+            AFTER {operation} ON notifications REFERENCING {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION {function}()
+    """
@@ -1,10 +1,12 @@
 import datetime
 from typing import List
 
-from sqlalchemy import ForeignKey, func, String
+from sqlalchemy import ForeignKey, func, String, BigInteger, Index, DDL, event, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from ..db import Base
+from . import ddl
 
 
 class User(Base):
@@ -15,7 +17,8 @@ class User(Base):
     name: Mapped[str] = mapped_column(nullable=False)
     department_id: Mapped[int] = mapped_column(
         ForeignKey("departments.id", ondelete="CASCADE"),
-        nullable=False
+        nullable=False,
+        index=True
     )
     create_at: Mapped[datetime.datetime] = mapped_column(default=func.now())
     admin: Mapped[bool] = mapped_column(default=False)
@@ -35,12 +38,27 @@ class User(Base):
 
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        # Keyset-пагинация /api/file/all по (uploaded_at, id) и её фильтры
+        Index("ix_documents_uploaded_at_id", "uploaded_at", "id"),
+        Index("ix_documents_doc_type_uploaded_at", "doc_type_id", "uploaded_at", "id"),
+        Index("ix_documents_responsible_uploaded_at", "responsible_id", "uploaded_at", "id"),
+        Index("ix_documents_permanent_uploaded_at", "permanent", "uploaded_at", "id"),
+        Index("ix_documents_uploaded_by_uploaded_at", "uploaded_by", "uploaded_at", "id"),
+        Index("ix_documents_valid_until_uploaded_at", "valid_until", "uploaded_at", "id"),
+        # Поиск /api/file/search: полнотекстовый и триграммный (опечатки, подстроки, префиксы)
+        Index("ix_documents_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_documents_original_filename_trgm", "original_filename",
+              postgresql_using="gin", postgresql_ops={"original_filename": "gin_trgm_ops"}),
+        Index("ix_documents_file_number_trgm", "file_number",
+              postgresql_using="gin", postgresql_ops={"file_number": "gin_trgm_ops"}),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
 
     filename: Mapped[str] = mapped_column(nullable=False)
     original_filename: Mapped[str] = mapped_column(nullable=False)
-    file_path: Mapped[str] = mapped_column(nullable=False)
+    file_path: Mapped[str] = mapped_column(nullable=False, index=True)  # индекс — для сборки мусора файлов
     file_number: Mapped[str] = mapped_column(nullable=True)
 
     doc_type_id: Mapped[int] = mapped_column(
@@ -58,6 +76,12 @@ class Document(Base):
 
     uploaded_by: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
 
+    # Содержимое в контентно-адресуемом хранилище (NULL — файл ещё лежит по старой схеме uploads/ГГГГ/ММ/ДД)
+    blob_digest: Mapped[str] = mapped_column(ForeignKey("blobs.digest"), nullable=True, index=True)
+
+    # Поддерживается триггером documents_search_vector_trigger (название, номер, тип документа, служба)
+    search_vector = mapped_column(TSVECTOR, nullable=True, deferred=True)
+
     doc_type = relationship(
         "DocType",
         back_populates="documents",
@@ -86,6 +110,19 @@ class Document(Base):
         return str(self)
 
 
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    digest: Mapped[str] = mapped_column(String(64), primary_key=True)  # SHA-256 содержимого
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    path: Mapped[str] = mapped_column(nullable=False)
+    refcount: Mapped[int] = mapped_column(nullable=False, default=1)
+    created_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now())
+
+    def __repr__(self):
+        return f"<Blob digest={self.digest} size={self.size} refcount={self.refcount}>"
+
+
 class DocType(Base):
     __tablename__ = "doc_types"
 
@@ -108,12 +145,24 @@ class DocType(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        # Непрочитанные пользователя по свежести: входящие, /api/file/inwork?is_read=false.
+        # Частичный: прочитанные (большинство строк) в индекс не попадают
+        Index("ix_notifications_user_unread_created", "user_id", "created_at", postgresql_where=text("NOT is_read")),
+        # История уведомлений: keyset-пагинация по (created_at, id)
+        Index("ix_notifications_user_created_id", "user_id", "created_at", "id"),
+        # Каскадное удаление с документом и выборки по документу
+        Index("ix_notifications_file_id", "file_id"),
+        # Помесячные секции, старые архивируются заданием maintain_notification_partitions
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     file_id: Mapped[int] = mapped_column(ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     message: Mapped[str] = mapped_column(nullable=False)
-    created_at: Mapped[datetime.datetime] = mapped_column(default=func.now())
+    # Ключ секционирования входит в первичный ключ
+    created_at: Mapped[datetime.datetime] = mapped_column(primary_key=True, default=func.now())
     is_read: Mapped[bool] = mapped_column(default=False)
 
     document = relationship("Document", back_populates="notifications")
@@ -127,6 +176,42 @@ class Notification(Base):
         return str(self)
 
 
+class NotificationCounter(Base):
+    """Число непрочитанных уведомлений пользователя. Поддерживается триггерами на notifications."""
+    __tablename__ = "notification_counters"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    unread: Mapped[int] = mapped_column(nullable=False, default=0, server_default="0")
+
+    def __repr__(self):
+        return f"<NotificationCounter user_id={self.user_id} unread={self.unread}>"
+
+
+class NotificationInbox(Base):
+    """
+    Уведомления пользователя о документе, свёрнутые в одну строку: время последнего и число непрочитанных.
+    Поддерживается триггерами на notifications; по ней листается /api/file/inwork.
+    """
+    __tablename__ = "notification_inbox"
+    __table_args__ = (
+        # Keyset-пагинация «В работе» по (notified_at, file_id)
+        Index("ix_notification_inbox_user_notified", "user_id", "notified_at", "file_id"),
+        # То же для ?is_read=false: документы с непрочитанными
+        Index("ix_notification_inbox_user_unread_notified", "user_id", "notified_at", "file_id",
+              postgresql_where=text("unread > 0")),
+    )
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    file_id: Mapped[int] = mapped_column(ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    notified_at: Mapped[datetime.datetime] = mapped_column(nullable=False)
+    unread: Mapped[int] = mapped_column(nullable=False, default=0, server_default="0")
+    total: Mapped[int] = mapped_column(nullable=False, default=0, server_default="0")
+
+    def __repr__(self):
+        return (f"<NotificationInbox user_id={self.user_id} file_id={self.file_id} "
+                f"notified_at={self.notified_at} unread={self.unread}>")
+
+
 class Department(Base):
     __tablename__ = "departments"
 
@@ -152,11 +237,18 @@ class Department(Base):
 
 class Responsible(Base):
     __tablename__ = "responsibles"
+    __table_args__ = (
+        # Проверка «пользователь — ответственный» и служба ответственного: /api/file/my, /api/file/readers
+        Index("ix_responsibles_user_department", "user_id", "department_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
 
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    department_id: Mapped[int] = mapped_column(ForeignKey("departments.id", ondelete="CASCADE"), nullable=False)
+    # Индекс нужен рассылке уведомлений службе (INSERT ... SELECT по department_id)
+    department_id: Mapped[int] = mapped_column(
+        ForeignKey("departments.id", ondelete="CASCADE"), nullable=False, index=True
+    )
 
     created_at: Mapped[datetime.datetime] = mapped_column(default=func.now())
 
@@ -165,3 +257,79 @@ class Responsible(Base):
 
     def __repr__(self):
         return f"<Responsible user_id={self.user_id} department_id={self.department_id}>"
+
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    filename: Mapped[str] = mapped_column(nullable=False)
+    total_size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    chunk_size: Mapped[int] = mapped_column(nullable=False)
+
+    # Метаданные будущего документа, как в /api/file/upload
+    responsible_id: Mapped[int] = mapped_column(nullable=False)
+    doc_type_id: Mapped[int] = mapped_column(nullable=False)
+    file_number: Mapped[str] = mapped_column(nullable=True)
+    permanent: Mapped[bool] = mapped_column(nullable=True)
+    valid_until: Mapped[datetime.date] = mapped_column(nullable=True)
+
+    created_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now())
+    expires_at: Mapped[datetime.datetime] = mapped_column(nullable=False, index=True)
+
+    chunks: Mapped[List["UploadChunk"]] = relationship(
+        back_populates="session",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
+
+    def __repr__(self):
+        return f"<UploadSession id={self.id} user_id={self.user_id} filename={self.filename!r}>"
+
+
+class UploadChunk(Base):
+    __tablename__ = "upload_chunks"
+
+    session_id: Mapped[str] = mapped_column(
+        ForeignKey("upload_sessions.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    index: Mapped[int] = mapped_column(primary_key=True)
+    size: Mapped[int] = mapped_column(nullable=False)
+    received_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now())
+
+    session: Mapped["UploadSession"] = relationship(back_populates="chunks")
+
+    def __repr__(self):
+        return f"<UploadChunk session_id={self.session_id} index={self.index} size={self.size}>"
+
+
+
+def ddl_statement(statement: str) -> DDL:
+    # DDL() подставляет параметры через %, поэтому % в тексте SQL экранируется
+    return DDL(statement.replace("%", "%%"))
+
+
+# Функции и триггеры для чистой базы, создаваемой create_all; существующие базы получают их из миграций.
+# События таблиц, а не Base.metadata: create_all пропускает существующие таблицы, и DDL не выполняется
+# заново при каждом запуске каждого воркера
+event.listen(Document.__table__, "before_create", ddl_statement(ddl.TRGM_EXTENSION))
+for _statement in ddl.SEARCH_VECTOR_FUNCTIONS + ddl.SEARCH_VECTOR_TRIGGERS:
+    event.listen(Document.__table__, "after_create", ddl_statement(_statement))
+
+for _statement in [
+    ddl.NOTIFICATIONS_CREATE_PARTITIONS_FUNCTION,
+    ddl.NOTIFICATIONS_DEFAULT_PARTITION,
+    """
+    SELECT notifications_create_partitions(
+        date_trunc('month', now())::date, (date_trunc('month', now()) + interval '2 months')::date
+    )
+    """,
+    ddl.NOTIFICATION_COUNTERS_FUNCTION,
+    *(ddl.statement_trigger(*trigger, "notification_counters_apply") for trigger in ddl.NOTIFICATION_COUNTER_TRIGGERS),
+    ddl.NOTIFICATION_INBOX_FUNCTION,
+    *(ddl.statement_trigger(*trigger, "notification_inbox_apply") for trigger in ddl.NOTIFICATION_INBOX_TRIGGERS),
+]:
+    event.listen(Notification.__table__, "after_create", ddl_statement(_statement))
@@ -0,0 +1,81 @@
+import contextvars
+import logging
+import re
+import time
+import uuid
+from typing import Optional
+
+# Данные текущего запроса для записей журнала. Хранится изменяемый словарь: пользователь становится
+# известен только в зависимости get_current_user, а маршрут — после сопоставления пути в роутере
+_request_context: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("request_context", default=None)
+
+REQUEST_ID_HEADER = "x-request-id"
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+actions_logger = logging.getLogger("actions")
+
+
+def set_request_user(user_id: int) -> None:
+    context = _request_context.get()
+    if context is not None:
+        context["user_id"] = user_id
+
+
+def request_log_fields() -> dict:
+    """
+    request_id, user_id, route и elapsed_ms — время от начала запроса до записи (не длительность всего запроса),
+    или пустой словарь вне запроса.
+    """
+    context = _request_context.get()
+    if context is None:
+        return {}
+    route = context["scope"].get("route")
+    return {
+        "request_id": context["request_id"],
+        "user_id": context["user_id"],
+        "route": f"{context['scope']['method']} {getattr(route, 'path', context['scope']['path'])}",
+        "elapsed_ms": round((time.perf_counter() - context["started"]) * 1000, 1),
+    }
+
+
+class RequestContextMiddleware:
+    """
+    Заполняет контекст запроса для журналов и возвращает X-Request-ID в ответе.
+    Id из заголовка запроса (от nginx или клиента) сохраняется, чтобы записи можно было сопоставить.
+    После отправки ответа пишет в actions.log одну итоговую запись: метод, маршрут, статус и duration_ms.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope["headers"]).get(REQUEST_ID_HEADER.encode("latin-1"), b"").decode("latin-1")
+        if not _REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex
+        token = _request_context.set({
+            "request_id": request_id, "user_id": None, "scope": scope, "started": time.perf_counter(),
+        })
+
+        # Если приложение упало до начала ответа, клиент получит 500 от ServerErrorMiddleware
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = [*message.get("headers", []),
+                                      (REQUEST_ID_HEADER.encode("latin-1"), request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Пишется до сброса контекста, чтобы фильтр журнала добавил request_id, user_id и route
+            fields = request_log_fields()
+            duration_ms = fields["elapsed_ms"]
+            actions_logger.info(f"{fields['route']} {status['code']} {duration_ms} ms",
+                                extra={"status": status["code"], "duration_ms": duration_ms, "elapsed_ms": duration_ms})
+            _request_context.reset(token)
@@ -1,7 +1,7 @@
 from datetime import date, datetime
 from typing import Optional, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from pydantic.utils import GetterDict
 
 
@@ -67,9 +67,39 @@ class DocumentOut(BaseModel):
         from_attributes = True  # ✅ для Pydantic 2
 
 
+class DocumentPage(BaseModel):
+    items: List[DocumentOut]
+    next_cursor: Optional[str] = None
+    total_estimate: Optional[int] = None
+
+
+class DocumentSearchPage(BaseModel):
+    items: List[DocumentOut]
+    next_offset: Optional[int] = None
+
+
 class NotificationCreate(BaseModel):
     file_id: int
-    message: str
+    # Уведомление рассылается через NOTIFY (не больше 8000 байт на сообщение)
+    message: str = Field(max_length=1000)
+
+
+class NotificationBulkRead(BaseModel):
+    # Список уходит в один UPDATE ... WHERE id IN (...): без предела один запрос держал бы блокировки на всём списке
+    ids: Optional[List[int]] = Field(None, max_length=1000)
+    file_id: Optional[int] = None
+    before: Optional[datetime] = None
+
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    total_size: int
+    chunk_size: Optional[int] = None
+    responsible: int
+    doc_type: int
+    doc_number: Optional[str] = None
+    is_permanent: Optional[bool] = False
+    valid_until: Optional[date] = None
 
 
 class RouteStepOut(BaseModel):
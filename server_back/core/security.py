@@ -1,3 +1,8 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -5,11 +10,14 @@ from fastapi import Depends, HTTPException, Request
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from starlette import status
 
-from core.db import get_async_session
+from core.config import settings
+from core.db import session_factory
 from core.models.models import User
+from core.request_context import set_request_user
+from core.utils import percentiles_ms
 
 SECRET_KEY = "your_secret"
 ALGORITHM = "HS256"
@@ -26,18 +34,218 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def _timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, started, time.perf_counter()
+
+
+class PasswordHasher:
+    """
+    bcrypt вне event loop: один вызов занимает ~250 мс процессора, и в обработчике он останавливал
+    все запросы воркера. Хэши считаются в отдельном пуле потоков (bcrypt отпускает GIL),
+    очередь ограничена: сверх workers + max_queue запросов отвечаем 429 с Retry-After.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        # Массовый импорт (hash_many): свой пул, в очередь входа не входит, но учитывается в метриках
+        self._import_in_flight = 0
+        self.import_completed = 0
+        # Последние замеры, с: время самого bcrypt и ожидание свободного потока
+        self._durations = deque(maxlen=1000)
+        self._waits = deque(maxlen=1000)
+
+    def _retry_after(self) -> int:
+        duration = sum(self._durations) / len(self._durations) if self._durations else 0.25
+        return max(1, math.ceil(self._in_flight / self.workers * duration))
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+
+    def _release_import(self) -> None:
+        self._import_in_flight -= 1
+
+    @staticmethod
+    def _submit(executor: ThreadPoolExecutor, release, func, *args) -> asyncio.Future:
+        """
+        Задача в пуле; release вызывается в event loop, когда поток действительно освободился.
+        Отмена запроса не останавливает bcrypt в потоке — место в очереди занято до его конца.
+        """
+        loop = asyncio.get_running_loop()
+
+        def done(_):
+            try:
+                loop.call_soon_threadsafe(release)
+            except RuntimeError:
+                # Цикл событий уже закрыт (остановка воркера)
+                pass
+
+        future = executor.submit(_timed, func, *args)
+        future.add_done_callback(done)
+        return asyncio.wrap_future(future)
+
+    async def _run(self, func, *args):
+        if self._in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Сервер перегружен, повторите попытку позже",
+                headers={"Retry-After": str(self._retry_after())}
+            )
+
+        self._in_flight += 1
+        submitted = time.perf_counter()
+        result, started, finished = await self._submit(self._executor, self._release, func, *args)
+        self.completed += 1
+        self._waits.append(started - submitted)
+        self._durations.append(finished - started)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash_many(self, passwords: list[str], workers: int) -> list[str]:
+        """
+        Хэши для массового импорта в отдельном временном пуле, чтобы импорт не занимал очередь входа.
+        Порядок результатов совпадает с порядком паролей.
+        """
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt-import")
+        self._import_in_flight += len(passwords)
+        try:
+            timed = await asyncio.gather(*(
+                self._submit(executor, self._release_import, get_password_hash, password) for password in passwords
+            ))
+        finally:
+            # Без ожидания: при отмене запроса оставшиеся хэши не нужны, а ждать их — блокировать event loop
+            executor.shutdown(wait=False, cancel_futures=True)
+        self.import_completed += len(timed)
+        self._durations.extend(finished - started for _, started, finished in timed)
+        return [result for result, _, _ in timed]
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_progress": min(self._in_flight, self.workers),
+            "queue_depth": max(0, self._in_flight - self.workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "import_in_progress": self._import_in_flight,
+            "import_completed": self.import_completed,
+            "hash_ms": percentiles_ms(self._durations),
+            "wait_ms": percentiles_ms(self._waits),
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_QUEUE)
+
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    issued_at = datetime.utcnow()
+    expire = issued_at + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "iat": issued_at})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-async def get_current_user(
-    request: Request,
-    db: AsyncSession = Depends(get_async_session)
-) -> User:
+class PrincipalCache:
+    """
+    Пользователи, уже прошедшие проверку токена: (id пользователя, iat токена) -> User со службой.
+    Объекты отсоединены от сессии и общие для всех запросов воркера — их нельзя изменять.
+    Запись живёт не дольше ttl секунд и сбрасывается при изменении или удалении пользователя
+    (в других воркерах — через NOTIFY, см. core.events.notify_principal_changed).
+    """
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[int, int], tuple[float, User]] = OrderedDict()
+        # Меняется при каждом сбросе: пользователь, прочитанный из БД до сброса, в кэш не попадёт
+        self.version = 0
+
+    def get(self, user_id: int, issued_at: int) -> Optional[User]:
+        key = (user_id, issued_at)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return user
+
+    def put(self, user_id: int, issued_at: int, user: User, version: int) -> None:
+        if version != self.version:
+            return
+        self._entries[(user_id, issued_at)] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end((user_id, issued_at))
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        self.version += 1
+        for key in [key for key in self._entries if key[0] == user_id]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self.version += 1
+        self._entries.clear()
+
+
+principal_cache = PrincipalCache(settings.PRINCIPAL_CACHE_SIZE, settings.PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+def _decode_token(token: str) -> Optional[dict]:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("id") is None and payload.get("username") is None:
+        return None
+    return payload
+
+
+async def _load_principal(payload: dict) -> Optional[User]:
+    """Пользователь из токена: из кэша без обращения к БД, иначе одним запросом вместе со службой."""
+    user_id = payload.get("id")
+    issued_at = payload.get("iat")
+    # Токены, выданные до появления iat, в кэш не попадают и проверяются по БД до истечения срока
+    cacheable = user_id is not None and issued_at is not None
+    if cacheable:
+        user = principal_cache.get(user_id, issued_at)
+        if user is not None:
+            return user
+
+    version = principal_cache.version
+    query = select(User).options(joinedload(User.department))
+    if user_id is not None:
+        query = query.where(User.id == user_id)
+    else:
+        query = query.where(User.username == payload["username"])
+    async with session_factory() as session:
+        result = await session.execute(query)
+        user = result.scalar_one_or_none()
+
+    if user is not None and cacheable:
+        principal_cache.put(user_id, issued_at, user, version)
+    return user
+
+
+async def get_current_user(request: Request) -> User:
     token = request.cookies.get("token")
     if not token:
         raise HTTPException(
@@ -45,28 +253,21 @@ async def get_current_user(
             detail="Not authenticated"
         )
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("username")
-        if username is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token payload"
-            )
-    except JWTError:
+    payload = _decode_token(token)
+    if payload is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate token"
         )
 
-    result = await db.execute(select(User).where(User.username == username))
-    user = result.scalar_one_or_none()
+    user = await _load_principal(payload)
 
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
+    set_request_user(user.id)
     return user
 
 
@@ -80,23 +281,17 @@ async def require_admin(user: User = Depends(get_current_user)) -> User:
     return user
 
 
-async def get_optional_user(
-    request: Request,
-    db: AsyncSession = Depends(get_async_session)
-) -> Optional[User]:
-    token = request.cookies.get("token")
+async def get_optional_user(request: Request) -> Optional[User]:
+    return await get_user_by_token(request.cookies.get("token"))
+
+
+async def get_user_by_token(token: Optional[str]) -> Optional[User]:
+    """Пользователь по токену из cookie или None. Используется там, где нет Request (WebSocket)."""
     if not token:
         return None
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("username")
-        if username is None:
-            return None
-    except JWTError:
+    payload = _decode_token(token)
+    if payload is None:
         return None
 
-    result = await db.execute(select(User).where(User.username == username))
-    user = result.scalar_one_or_none()
-
-    return user
+    return await _load_principal(payload)
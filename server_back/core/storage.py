@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import select, update, delete, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models.models import Blob
+from core.utils import UPLOAD_DIR
+
+CAS_DIR = os.path.join(UPLOAD_DIR, "cas")
+
+error_logger = logging.getLogger("errors")
+
+
+def blob_path(digest: str) -> str:
+    # uploads/cas/ab/cd/abcd... — не больше 65536 каталогов, в каждом немного файлов
+    return os.path.join(CAS_DIR, digest[:2], digest[2:4], digest)
+
+
+def _place_blob(tmp_path: str, path: str, is_new: bool) -> None:
+    if is_new or not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+    else:
+        # Такое содержимое уже хранится — копия не нужна
+        os.remove(tmp_path)
+
+
+async def _lock_digest(db: AsyncSession, digest: str) -> None:
+    # Запись в blobs и файл на диске меняются согласованно: register_blob, release_blob и remove_blob_file
+    # одного содержимого выполняются по очереди (блокировка снимается в конце транзакции)
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:digest))"), {"digest": digest})
+
+
+async def lock_digests(db: AsyncSession, *digests: Optional[str]) -> None:
+    """
+    Блокирует несколько содержимых до конца транзакции в порядке digest. Нужна, если в одной транзакции
+    регистрируется одно содержимое и освобождается другое: встречные замены A→B и B→A иначе взаимоблокируются.
+    """
+    for digest in sorted({digest for digest in digests if digest}):
+        await _lock_digest(db, digest)
+
+
+async def register_blob(db: AsyncSession, digest: str, size: int) -> bool:
+    """
+    Увеличивает счётчик ссылок содержимого (создаёт запись в blobs, если его ещё нет).
+    Файл кладёт place_blob; коммит — на стороне вызывающего. Возвращает True, если содержимое новое.
+    """
+    # До конца транзакции вызывающего: remove_blob_file того же содержимого ждёт коммита
+    await _lock_digest(db, digest)
+    result = await db.execute(
+        insert(Blob)
+        .values(digest=digest, size=size, path=blob_path(digest), refcount=1)
+        .on_conflict_do_update(index_elements=[Blob.digest], set_={"refcount": Blob.refcount + 1})
+        .returning(Blob.refcount)
+    )
+    return result.scalar_one() == 1
+
+
+async def place_blob(tmp_path: str, digest: str, is_new: bool) -> str:
+    """Переносит сохранённый файл в хранилище после register_blob. Возвращает путь к содержимому."""
+    path = blob_path(digest)
+    await asyncio.to_thread(_place_blob, tmp_path, path, is_new)
+    return path
+
+
+async def store_blob(db: AsyncSession, tmp_path: str, digest: str, size: int) -> str:
+    """
+    Кладёт сохранённый файл в хранилище по его SHA-256 и увеличивает счётчик ссылок.
+    Коммит — на стороне вызывающего, в одной транзакции с записью документа.
+    Возвращает путь к содержимому в хранилище.
+
+    Файл кладётся до коммита: при откате новое содержимое остаётся на диске без записи в blobs.
+    Такой файл подбирает сборка мусора (core.file_gc) по истечении FILE_GC_GRACE_HOURS.
+    """
+    is_new = await register_blob(db, digest, size)
+    return await place_blob(tmp_path, digest, is_new)
+
+
+async def release_blob(db: AsyncSession, digest: str) -> Optional[str]:
+    """
+    Уменьшает счётчик ссылок. Если ссылок не осталось — удаляет запись и возвращает путь,
+    который нужно удалить с диска после коммита (remove_blob_file).
+    """
+    # Как в register_blob: уменьшение счётчика и удаление записи не пересекаются с регистрацией того же
+    # содержимого, и блокировки всегда берутся в одном порядке — сначала digest, затем строка blobs
+    await _lock_digest(db, digest)
+    result = await db.execute(
+        update(Blob)
+        .where(Blob.digest == digest)
+        .values(refcount=Blob.refcount - 1)
+        .returning(Blob.refcount, Blob.path)
+    )
+    row = result.one_or_none()
+    if row is None or row.refcount > 0:
+        return None
+    await db.execute(delete(Blob).where(Blob.digest == digest, Blob.refcount <= 0))
+    return row.path
+
+
+async def remove_blob_file(db: AsyncSession, path: str) -> None:
+    """
+    Удаление содержимого с диска после коммита release_blob, если за это время на него не появилась новая ссылка.
+    Выполняется в отдельной транзакции под блокировкой содержимого: параллельный register_blob не может
+    между проверкой и удалением добавить запись и положить файл.
+    """
+    digest = os.path.basename(path)
+    try:
+        await _lock_digest(db, digest)
+        still_used = await db.scalar(select(Blob.digest).where(Blob.digest == digest))
+        if not still_used:
+            try:
+                await asyncio.to_thread(os.remove, path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                error_logger.error(f"Не удалось удалить файл хранилища {path}: {e}")
+    finally:
+        await db.commit()
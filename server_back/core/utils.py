@@ -1,15 +1,38 @@
+import asyncio
+import base64
+import hashlib
 import os
+import shutil
 import uuid
 from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, BinaryIO
 
-from fastapi import UploadFile
+from fastapi import UploadFile, HTTPException
+
+from core.config import settings
 
 UPLOAD_DIR = "uploads"
+SESSIONS_DIR = os.path.join(UPLOAD_DIR, ".sessions")
+
+
+def percentiles_ms(samples) -> dict:
+    """Среднее, медиана, p95, p99 и максимум замеров в секундах — в миллисекундах."""
+    if not samples:
+        return {"avg": None, "p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+    return {
+        "avg": round(sum(ordered) / len(ordered) * 1000, 1),
+        "p50": round(ordered[len(ordered) // 2] * 1000, 1),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+        "p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 1),
+        "max": round(ordered[-1] * 1000, 1),
+    }
 
 
-async def save_file_with_uuid(file: UploadFile) -> tuple[str, str]:
+def _new_upload_path(filename: str) -> str:
     # Расширение файла
-    ext = os.path.splitext(file.filename)[-1]
+    ext = os.path.splitext(filename)[-1]
 
     # Уникальное имя
     unique_filename = f"{uuid.uuid4()}{ext}"
@@ -20,11 +43,188 @@ async def save_file_with_uuid(file: UploadFile) -> tuple[str, str]:
     os.makedirs(save_dir, exist_ok=True)
 
     # Полный путь к файлу
-    full_path = os.path.join(save_dir, unique_filename)
+    return os.path.join(save_dir, unique_filename)
+
+
+def _write_block(f: BinaryIO, hasher, block: bytes) -> None:
+    # hashlib и запись на диск отпускают GIL, поэтому выполняем их в потоке
+    hasher.update(block)
+    f.write(block)
+
+
+async def save_stream_with_uuid(chunks: AsyncIterator[bytes], filename: str) -> tuple[str, int, str]:
+    """
+    Потоковое сохранение файла: тело читается порциями, в памяти держится не больше
+    UPLOAD_CHUNK_SIZE байт, запись и хеширование выполняются вне event loop.
+    Файл пишется во временный *.part рядом с итоговым и переименовывается после успешной записи.
+    Возвращает путь к файлу, размер и SHA-256.
+    """
+    full_path = await asyncio.to_thread(_new_upload_path, filename)
+    tmp_path = full_path + ".part"
+
+    hasher = hashlib.sha256()
+    size = 0
+    buffer = bytearray()
+    f = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            size += len(chunk)
+            if size > settings.UPLOAD_MAX_SIZE:
+                raise HTTPException(status_code=413, detail="Файл слишком большой")
+            buffer += chunk
+            if len(buffer) >= settings.UPLOAD_CHUNK_SIZE:
+                block, buffer = bytes(buffer), bytearray()
+                await asyncio.to_thread(_write_block, f, hasher, block)
+        if buffer:
+            await asyncio.to_thread(_write_block, f, hasher, bytes(buffer))
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.replace, tmp_path, full_path)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        if os.path.exists(tmp_path):
+            await asyncio.to_thread(os.remove, tmp_path)
+        raise
+
+    return full_path, size, hasher.hexdigest()
+
+
+async def iter_upload_file(file: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+
+def session_part_path(session_id: str) -> str:
+    return os.path.join(SESSIONS_DIR, f"{session_id}.part")
+
+
+def create_session_file(session_id: str, total_size: int) -> None:
+    """Создаёт разреженный файл итогового размера, в который части пишутся по своим смещениям."""
+    os.makedirs(SESSIONS_DIR, exist_ok=True)
+    with open(session_part_path(session_id), "wb") as f:
+        f.truncate(total_size)
+
+
+def remove_session_file(session_id: str) -> None:
+    path = session_part_path(session_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _pwrite_all(fd: int, data: bytes, offset: int) -> None:
+    # pwrite может записать меньше, чем передано (сигнал, нехватка места): дописываем остаток
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view, offset = view[written:], offset + written
+
+
+async def write_stream_at(session_id: str, offset: int, chunks: AsyncIterator[bytes], expected_size: int) -> int:
+    """
+    Записывает тело запроса в файл сессии начиная с offset.
+    Части одной сессии могут писаться параллельно: каждая пишет только в свой диапазон (pwrite).
+    """
+    fd = await asyncio.to_thread(os.open, session_part_path(session_id), os.O_WRONLY)
+    written = 0
+    buffer = bytearray()
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            if written + len(buffer) + len(chunk) > expected_size:
+                raise HTTPException(status_code=400, detail="Размер части превышает ожидаемый")
+            buffer += chunk
+            if len(buffer) >= settings.UPLOAD_CHUNK_SIZE:
+                block, buffer = bytes(buffer), bytearray()
+                await asyncio.to_thread(_pwrite_all, fd, block, offset + written)
+                written += len(block)
+        if buffer:
+            await asyncio.to_thread(_pwrite_all, fd, bytes(buffer), offset + written)
+            written += len(buffer)
+    finally:
+        await asyncio.to_thread(os.close, fd)
+    return written
+
+
+def _hash_file(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(settings.UPLOAD_CHUNK_SIZE):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _move_session_file(session_id: str, filename: str) -> tuple[str, int, str]:
+    part_path = session_part_path(session_id)
+    sha256 = _hash_file(part_path)
+    full_path = _new_upload_path(filename)
+    os.replace(part_path, full_path)
+    return full_path, os.path.getsize(full_path), sha256
+
+
+async def finalize_session_file(session_id: str, filename: str) -> tuple[str, int, str]:
+    """Переносит собранный файл сессии в папку по дате. Возвращает путь, размер и SHA-256."""
+    return await asyncio.to_thread(_move_session_file, session_id, filename)
+
+
+def restore_session_file(session_id: str, path: str, stored_path: str | None = None) -> None:
+    """
+    Возвращает файл, перенесённый finalize_session_file, в сессию, если документ по нему не создан.
+    Если файл уже перенесён в хранилище (не прошёл коммит), в сессию копируется содержимое из stored_path:
+    сам файл хранилища мог быть общим с другими документами.
+    """
+    part_path = session_part_path(session_id)
+    if os.path.exists(path):
+        os.replace(path, part_path)
+    elif stored_path and os.path.exists(stored_path):
+        tmp_path = f"{part_path}.restore"
+        shutil.copyfile(stored_path, tmp_path)
+        os.replace(tmp_path, part_path)
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """Сравнение ETag с заголовком If-None-Match (слабое сравнение, список через запятую или *)."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == bare for candidate in header.split(","))
+
+
+def not_modified_since(header: str | None, last_modified: float) -> bool:
+    """Проверка If-Modified-Since: ресурс не менялся с указанного момента (точность — секунда)."""
+    if not header:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    return int(last_modified) <= int(since.timestamp())
+
+
+def notification_retention_cutoff(now: datetime | None = None) -> datetime:
+    """
+    Начало самой старой хранимой секции уведомлений: более старые архивируются и удаляются.
+    Условие created_at >= cutoff позволяет планировщику не заглядывать в секции, которые ждут архивации.
+    """
+    now = now or datetime.utcnow()
+    months = now.year * 12 + now.month - 1 - settings.NOTIFICATION_RETENTION_MONTHS
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+def encode_cursor(*values) -> str:
+    """Курсор для keyset-пагинации: значения ключа сортировки последней строки страницы."""
+    raw = "|".join(v.isoformat() if isinstance(v, datetime) else str(v) for v in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
 
-    # Сохранение файла
-    with open(full_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
 
-    return full_path, file.filename  # путь к файлу и оригинальное имя
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Разбор курсора вида (datetime, id)."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        moment, row_id = raw.split("|")
+        return datetime.fromisoformat(moment), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Неверный курсор")
@@ -11,9 +11,15 @@ from api.routes.admin import router as admin_routes
 from api.routes.file import router as router_file
 from api.routes.login import router as router_auth
 from api.routes.notification import router as router_notification
-from core.apsched import backup_postgres
-from core.config import settings, init_logging
-from core.db import engine, Base
+from api.routes.upload_session import router as router_upload_session
+from core.apsched import backup_postgres, cleanup_upload_sessions, maintain_notification_partitions
+from core.config import settings, init_logging, stop_logging
+from core.db import engine, Base, ReadYourWritesMiddleware
+from core.request_context import RequestContextMiddleware
+from core.events import listener
+from core.file_gc import run_file_gc
+from core.maintenance import run_all_maintenance_jobs
+from core.security import password_hasher
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 scheduler = AsyncIOScheduler()
@@ -52,10 +58,14 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    app.add_middleware(ReadYourWritesMiddleware)
+    # Последним добавлен — выполняется первым: id запроса есть у всех записей журнала
+    app.add_middleware(RequestContextMiddleware)
     os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 
     app.include_router(router_auth)
     app.include_router(router_file)
+    app.include_router(router_upload_session)
     app.include_router(router_notification)
     app.include_router(admin_routes)
 
@@ -71,14 +81,33 @@ async def startup_event():
 
     # 🕒 Бэкап в 03:00 каждый день
     scheduler.add_job(backup_postgres, trigger='cron', hour=14, minute=34, id='backup_postgres')
+    # Истёкшие сессии загрузки по частям
+    scheduler.add_job(cleanup_upload_sessions, trigger='interval', minutes=30, id='cleanup_upload_sessions')
+    # Секции уведомлений на следующие месяцы и архивация старых
+    scheduler.add_job(maintain_notification_partitions, trigger='cron', hour=3, minute=30,
+                      id='maintain_notification_partitions')
+    # Ссылочная целостность: висячие и повторные ответственные, уведомления без документа или пользователя
+    scheduler.add_job(run_all_maintenance_jobs, trigger='cron', hour=4, minute=0, id='run_all_maintenance_jobs')
+    # Файлы без ссылок из БД: карантин и удаление просроченного карантина
+    scheduler.add_job(run_file_gc, trigger='cron', hour=4, minute=30, id='run_file_gc')
 
     scheduler.start()
 
+    # События уведомлений от всех воркеров (LISTEN/NOTIFY) для WebSocket-клиентов этого процесса
+    listener.start()
+
     init_logging()
     action_logger = logging.getLogger("actions")
     action_logger.info("Приложение запущено.")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await listener.stop()
+    password_hasher.shutdown()
+    stop_logging()
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
 
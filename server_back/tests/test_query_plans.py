@@ -0,0 +1,47 @@
+"""
+Планы запросов горячих эндпоинтов (tools/check_query_plans) как тесты: по тесту на каждую проверку CHECKS.
+
+Нужна отдельная база с применёнными миграциями (в том числе pg_trgm для /api/file/search): тест наполняет её
+синтетическими данными и удаляет их в конце. Без PLANS_TEST_DATABASE тесты пропускаются. Из папки server_back:
+    PLANS_TEST_DATABASE=fileserver_plans python -m pytest tests/test_query_plans.py
+"""
+import asyncio
+import os
+
+import pytest
+
+PLANS_TEST_DATABASE = os.environ.get("PLANS_TEST_DATABASE")
+if not PLANS_TEST_DATABASE:
+    pytest.skip("не задана PLANS_TEST_DATABASE — база для проверки планов", allow_module_level=True)
+# База приложения выбирается при импорте core.db
+os.environ["PS_TABLE_NAME"] = PLANS_TEST_DATABASE
+
+from core.db import engine, replica_engine  # noqa: E402
+from tools.check_query_plans import CHECKS, _cleanup, _seed, check_endpoints  # noqa: E402
+
+# Меньше, чем в скрипте по умолчанию, но большие таблицы всё равно выше SEQ_SCAN_MIN_ROWS
+SEED = {"users": 20000, "departments": 40, "documents": 100000, "notifications": 500000, "months": 6}
+
+
+async def _check_plans() -> list[dict]:
+    values = await _seed(**SEED)
+    try:
+        return await check_endpoints(values)
+    finally:
+        await _cleanup(values["prefix"])
+        # Пул привязан к циклу событий asyncio.run и закрывается вместе с ним
+        await engine.dispose()
+        if replica_engine is not None:
+            await replica_engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def plan_results() -> list[dict]:
+    return asyncio.run(_check_plans())
+
+
+@pytest.mark.parametrize("index", range(len(CHECKS)),
+                         ids=[f"{path} {params}" if params else path for path, params, _ in CHECKS])
+def test_query_plan(plan_results, index):
+    result = plan_results[index]
+    assert not result["problems"], f"{result['label']}:\n" + "\n".join(result["problems"])
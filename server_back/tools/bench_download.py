@@ -0,0 +1,85 @@
+"""
+Нагрузочное сравнение отдачи файлов: приложение напрямую против DOWNLOAD_OFFLOAD (nginx X-Accel-Redirect).
+
+Параллельно со скачиваниями замеряется задержка лёгкого API-запроса, чтобы видеть,
+насколько отдача файлов мешает остальному API.
+
+Запуск из папки server_back (дважды — для каждого режима):
+    python -m tools.bench_download --base-url http://localhost:8000 --file-id 1 --username admin --password ...
+    python -m tools.bench_download --base-url http://localhost --file-id 1 --username admin --password ...
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def _download_worker(client: httpx.AsyncClient, url: str, count: int, sizes: list[int]) -> None:
+    for _ in range(count):
+        size = 0
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+        sizes.append(size)
+
+
+async def _probe_worker(client: httpx.AsyncClient, url: str, stop: asyncio.Event, latencies: list[float]) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get(url)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.05)
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+async def run(args) -> None:
+    limits = httpx.Limits(max_connections=args.concurrency + 2)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=None) as client:
+        response = await client.post("/api/auth/signin", json={"username": args.username, "password": args.password})
+        response.raise_for_status()
+
+        sizes: list[int] = []
+        latencies: list[float] = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe_worker(client, args.probe_path, stop, latencies))
+
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            _download_worker(client, f"/api/file/download/{args.file_id}", args.requests, sizes)
+            for _ in range(args.concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+    total_mb = sum(sizes) / 1024 / 1024
+    print(f"Скачиваний: {len(sizes)}, объём: {total_mb:.1f} МБ, время: {elapsed:.2f} с")
+    print(f"Пропускная способность: {total_mb / elapsed:.1f} МБ/с, {len(sizes) / elapsed:.1f} файлов/с")
+    if latencies:
+        print(f"Задержка {args.probe_path} под нагрузкой: "
+              f"p50={statistics.median(latencies) * 1000:.1f} мс, p99={_percentile(latencies, 0.99) * 1000:.1f} мс")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сравнение отдачи файлов напрямую и через обратный прокси")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--file-id", type=int, required=True)
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=10, help="скачиваний на одного клиента")
+    parser.add_argument("--probe-path", default="/api/file/doc-type")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
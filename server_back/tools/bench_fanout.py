@@ -0,0 +1,123 @@
+"""
+Сравнение рассылки уведомлений при загрузке документа: по строке на каждого ответственного
+(как было в upload_with_route) против одного INSERT ... SELECT из responsibles (create_document).
+
+Скрипт создаёт временную службу с N ответственными, пишет документы без файлов и удаляет всё за собой.
+
+Запуск из папки server_back:
+    python -m tools.bench_fanout
+    python -m tools.bench_fanout --sizes 10 1000 10000 --repeat 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime
+
+from sqlalchemy import select, insert, delete, text, literal, func, false
+
+from core.db import session_factory
+from core.models.models import Document, Notification, Responsible, Department, DocType, User
+
+BENCH_PREFIX = "bench-fanout"
+
+
+async def _prepare(size: int) -> tuple[int, int, int]:
+    """Служба из size пользователей-ответственных. Возвращает (department_id, doc_type_id, uploader_id)."""
+    async with session_factory() as session:
+        department = Department(name=f"{BENCH_PREFIX}-{size}-{time.time_ns()}")
+        doc_type = await session.scalar(select(DocType).limit(1))
+        if doc_type is None:
+            doc_type = DocType(name=f"{BENCH_PREFIX}-{time.time_ns()}")
+            session.add(doc_type)
+        session.add(department)
+        await session.flush()
+
+        await session.execute(text("""
+            INSERT INTO users (username, password, name, department_id, create_at, admin)
+            SELECT :prefix || '-' || g, '!', :prefix || ' ' || g, :department_id, now(), false
+            FROM generate_series(1, :size) AS g
+        """), {"prefix": department.name, "department_id": department.id, "size": size})
+        await session.execute(text("""
+            INSERT INTO responsibles (user_id, department_id, created_at)
+            SELECT id, department_id, now() FROM users WHERE department_id = :department_id
+        """), {"department_id": department.id})
+        uploader_id = await session.scalar(select(func.min(User.id)).where(User.department_id == department.id))
+        await session.commit()
+        return department.id, doc_type.id, uploader_id
+
+
+async def _cleanup(department_id: int) -> None:
+    async with session_factory() as session:
+        # Пользователи удаляются каскадом, за ними документы и уведомления
+        await session.execute(delete(User).where(User.department_id == department_id))
+        await session.execute(delete(Department).where(Department.id == department_id))
+        await session.commit()
+
+
+def _document(doc_type_id: int, department_id: int, uploader_id: int) -> Document:
+    return Document(
+        filename="bench", original_filename="bench.txt", file_path="bench",
+        doc_type_id=doc_type_id, responsible_id=department_id, uploaded_by=uploader_id,
+        uploaded_at=datetime.utcnow(), permanent=True,
+    )
+
+
+async def per_row(doc_type_id: int, department_id: int, uploader_id: int) -> None:
+    async with session_factory() as session:
+        doc = _document(doc_type_id, department_id, uploader_id)
+        session.add(doc)
+        await session.commit()
+        await session.refresh(doc)
+
+        responsible_users = await session.execute(
+            select(Responsible).where(Responsible.department_id == department_id)
+        )
+        for resp in responsible_users.scalars():
+            session.add(Notification(file_id=doc.id, user_id=resp.user_id, message="Вам назначен новый файл"))
+        await session.commit()
+
+
+async def set_based(doc_type_id: int, department_id: int, uploader_id: int) -> None:
+    async with session_factory() as session:
+        doc = _document(doc_type_id, department_id, uploader_id)
+        session.add(doc)
+        await session.flush()
+        await session.execute(
+            insert(Notification).from_select(
+                ["file_id", "user_id", "message", "created_at", "is_read"],
+                select(
+                    literal(doc.id), Responsible.user_id, literal("Вам назначен новый файл"), func.now(), false()
+                ).where(Responsible.department_id == department_id).distinct()
+            )
+        )
+        await session.commit()
+
+
+async def run(sizes: list[int], repeat: int) -> None:
+    print(f"{'ответственных':>14} {'способ':>10} {'медиана, мс':>12} {'макс, мс':>10}")
+    for size in sizes:
+        department_id, doc_type_id, uploader_id = await _prepare(size)
+        try:
+            for name, strategy in (("per-row", per_row), ("set-based", set_based)):
+                await strategy(doc_type_id, department_id, uploader_id)  # прогрев
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    await strategy(doc_type_id, department_id, uploader_id)
+                    timings.append((time.perf_counter() - started) * 1000)
+                print(f"{size:>14} {name:>10} {statistics.median(timings):>12.1f} {max(timings):>10.1f}")
+        finally:
+            await _cleanup(department_id)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк рассылки уведомлений при загрузке документа")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Задержка PUT /api/file/update при записи журналов прямо в потоке запроса (как было)
+и через очередь QueueHandler/QueueListener (init_logging по умолчанию).
+
+Эндпоинт делает четыре записи в actions.log на запрос; при прямой записи каждая — синхронный
+вызов write() (а при переполнении файла — ротация) в event loop, и все параллельные запросы ждут диск.
+Скрипт создаёт пользователя и документ, вызывает эндпоинт в этом же процессе с заданной
+параллельностью и печатает avg/p50/p95/p99/max для обоих режимов. Журналы пишутся в --log-dir,
+чтобы не засорять рабочие; для честного сравнения каталог должен быть на том же диске, что и logs/.
+
+Запуск из папки server_back:
+    python -m tools.bench_logging
+    python -m tools.bench_logging --requests 5000 --concurrency 50 --log-dir /var/tmp/bench-logs
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+from sqlalchemy import select, delete
+
+from core import config
+from core.db import session_factory
+from core.models.models import Department, DocType, Document, User
+from core.security import get_password_hash
+from core.utils import percentiles_ms
+from main import app
+
+BENCH_PREFIX = "bench-logging"
+
+
+async def _prepare() -> tuple[str, str, int]:
+    """Пользователь с документом. Возвращает (username, password, file_id)."""
+    username = f"{BENCH_PREFIX}-{time.time_ns()}"
+    password = uuid.uuid4().hex
+    async with session_factory() as session:
+        department = Department(name=username)
+        doc_type = await session.scalar(select(DocType).limit(1))
+        if doc_type is None:
+            doc_type = DocType(name=username)
+            session.add(doc_type)
+        session.add(department)
+        await session.flush()
+        user = User(username=username, password=get_password_hash(password), name=username,
+                    department_id=department.id, create_at=datetime.utcnow(), admin=False)
+        session.add(user)
+        await session.flush()
+        document = Document(
+            filename="bench", original_filename="bench.txt", file_path="bench",
+            doc_type_id=doc_type.id, responsible_id=department.id, uploaded_by=user.id,
+            uploaded_at=datetime.utcnow(), permanent=True,
+        )
+        session.add(document)
+        await session.commit()
+        return username, password, document.id
+
+
+async def _cleanup(username: str) -> None:
+    async with session_factory() as session:
+        # Документ удаляется каскадом вместе с пользователем
+        await session.execute(delete(User).where(User.username == username))
+        await session.execute(delete(Department).where(Department.name == username))
+        await session.execute(delete(DocType).where(DocType.name == username))
+        await session.commit()
+
+
+async def _run(client: httpx.AsyncClient, file_id: int, requests: int, concurrency: int) -> list[float]:
+    latencies: list[float] = []
+    queue = asyncio.Queue()
+    for index in range(requests):
+        queue.put_nowait(index)
+
+    async def worker():
+        while not queue.empty():
+            index = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.put(f"/api/file/update/{file_id}",
+                                        json={"doc_number": f"N-{index}", "permanent": True})
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+async def run(args) -> None:
+    # init_logging пишет в config.LOGS_DIR: на время замера — во временный каталог
+    config.LOGS_DIR = Path(args.log_dir or tempfile.mkdtemp(prefix="bench-logging-"))
+    os.makedirs(config.LOGS_DIR, exist_ok=True)
+    username, password, file_id = await _prepare()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            response = await client.post("/api/auth/signin", json={"username": username, "password": password})
+            response.raise_for_status()
+
+            print(f"журналы: {config.LOGS_DIR}, запросов: {args.requests}, параллельно: {args.concurrency}")
+            print(f"{'режим':<12} {'avg':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  мс")
+            for mode, use_queue in (("напрямую", False), ("очередь", True)):
+                config.init_logging(use_queue=use_queue)
+                # Прогрев: соединения пула, кэш пользователя, подготовленные выражения
+                await _run(client, file_id, min(100, args.requests), args.concurrency)
+                stats = percentiles_ms(await _run(client, file_id, args.requests, args.concurrency))
+                print(f"{mode:<12} {stats['avg']:>8} {stats['p50']:>8} {stats['p95']:>8} {stats['p99']:>8} "
+                      f"{stats['max']:>8}")
+    finally:
+        config.stop_logging()
+        await _cleanup(username)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Задержка /api/file/update при прямой и асинхронной записи журналов")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--log-dir", help="каталог для журналов замера (по умолчанию — временный)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Перенос файлов, загруженных до появления хранилища по SHA-256 (uploads/ГГГГ/ММ/ДД),
+в контентно-адресуемое хранилище с дедупликацией.
+
+Запуск из папки server_back:
+    python -m tools.cas_migrate --dry-run    # только отчёт: сколько файлов и места освободится
+    python -m tools.cas_migrate              # перенос
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+
+from sqlalchemy import select
+
+from core.config import settings
+from core.db import session_factory
+from core.models.models import Document, Blob
+from core.storage import store_blob
+
+BATCH_SIZE = 200
+
+
+def _hash_file(path: str) -> tuple[str, int]:
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while block := f.read(settings.UPLOAD_CHUNK_SIZE):
+            hasher.update(block)
+            size += len(block)
+    return hasher.hexdigest(), size
+
+
+async def migrate(dry_run: bool) -> None:
+    last_id = 0
+    migrated = missing = duplicates = 0
+    saved_bytes = 0
+    seen: set[str] = set()
+
+    while True:
+        async with session_factory() as session:
+            result = await session.execute(
+                select(Document)
+                .where(Document.blob_digest.is_(None), Document.id > last_id)
+                .order_by(Document.id)
+                .limit(BATCH_SIZE)
+            )
+            documents = result.scalars().all()
+            if not documents:
+                break
+            old_paths = []
+
+            for doc in documents:
+                last_id = doc.id
+                if not os.path.exists(doc.file_path):
+                    missing += 1
+                    print(f"[missing] document {doc.id}: {doc.file_path}")
+                    continue
+
+                digest, size = await asyncio.to_thread(_hash_file, doc.file_path)
+                exists = digest in seen or await session.get(Blob, digest) is not None
+                if exists:
+                    duplicates += 1
+                    saved_bytes += size
+                seen.add(digest)
+
+                if dry_run:
+                    continue
+                # Жёсткая ссылка: исходный файл удаляется только после коммита
+                tmp_path = doc.file_path + ".cas"
+                await asyncio.to_thread(os.link, doc.file_path, tmp_path)
+                old_paths.append(doc.file_path)
+                doc.file_path = await store_blob(session, tmp_path, digest, size)
+                doc.blob_digest = digest
+                migrated += 1
+
+            if not dry_run:
+                await session.commit()
+                for path in old_paths:
+                    os.remove(path)
+
+    print(f"Документов перенесено: {migrated}, дубликатов: {duplicates}, "
+          f"освобождено: {saved_bytes / 1024 / 1024:.1f} МБ, файлов не найдено: {missing}"
+          + (" (пробный запуск)" if dry_run else ""))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Перенос загруженных файлов в хранилище по SHA-256")
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать, ничего не менять")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Проверка планов запросов горячих эндпоинтов на большом синтетическом наборе данных.
+
+Скрипт наполняет БД документами, пользователями и уведомлениями, вызывает эндпоинты приложения
+в этом же процессе, перехватывает их SELECT-запросы и выполняет для каждого EXPLAIN (FORMAT JSON).
+Проверка не проходит, если план читает большую таблицу последовательным сканированием (Seq Scan)
+или его стоимость превышает бюджет эндпоинта. Так регрессии вроде потерянного индекса
+или переписанного запроса видны до выката, а не по жалобам на медленные страницы.
+
+Запускать на отдельной базе с применёнными миграциями: скрипт пишет сотни тысяч строк
+и удаляет их в конце (кроме --keep). Из папки server_back:
+    PS_TABLE_NAME=fileserver_plans python -m tools.check_query_plans
+    PS_TABLE_NAME=fileserver_plans python -m tools.check_query_plans --documents 500000 --notifications 3000000
+
+Код возврата 1 — хотя бы один план не прошёл проверку.
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+import uuid
+
+import httpx
+from sqlalchemy import event, select, delete, text
+
+from core.db import engine, replica_engine, session_factory
+from core.models.models import Department, DocType, User
+from core.security import get_password_hash
+from main import app
+
+PLANS_PREFIX = "plans-check"
+# Запросы без таблиц (SELECT pg_notify(...), SELECT 1) не проверяются
+FROM_RE = re.compile(r"\bFROM\b", re.IGNORECASE)
+
+# Таблицы, которые в рабочей базе большие; остальные (службы, типы документов) сканировать дёшево
+LARGE_TABLES = {"documents", "notifications", "notification_inbox", "responsibles", "users", "upload_sessions",
+                "upload_chunks"}
+# Seq Scan по таблице или секции меньше этого числа строк допустим: пустые секции будущих месяцев,
+# notifications_default и несколько тысяч ответственных планировщик законно читает целиком
+SEQ_SCAN_MIN_ROWS = 10000
+
+# Эндпоинт, параметры запроса и бюджет стоимости плана (в единицах планировщика)
+CHECKS = [
+    ("/api/file/all", {}, 2000),
+    ("/api/file/all", {"responsible_id": "{department_id}"}, 2000),
+    ("/api/file/all", {"doc_type_id": "{doc_type_id}"}, 2000),
+    ("/api/file/all", {"permanent": "true"}, 2000),
+    ("/api/file/all", {"uploaded_by": "{user_id}"}, 2000),
+    ("/api/file/all", {"cursor": "{cursor}"}, 2000),
+    ("/api/file/my", {}, 5000),
+    ("/api/file/inwork", {}, 2000),
+    ("/api/file/inwork", {"is_read": "false"}, 2000),
+    ("/api/file/search", {"q": "Документ 123456"}, 5000),
+    ("/api/file/search", {"q": "N-12345"}, 5000),
+    ("/api/file/readers/{file_id}", {}, 2000),
+    ("/api/file/info/{file_id}", {}, 100),
+    ("/api/notification/", {}, 5000),
+    ("/api/notification/count", {}, 100),
+    ("/api/notification/history", {}, 2000),
+    ("/api/notification/history", {"is_read": "false"}, 2000),
+]
+
+
+async def _seed(users: int, departments: int, documents: int, notifications: int, months: int) -> dict:
+    """Синтетические данные с префиксом PLANS_PREFIX. Возвращает значения для подстановки в CHECKS."""
+    prefix = f"{PLANS_PREFIX}-{time.time_ns()}"
+    password = uuid.uuid4().hex
+    async with session_factory() as session:
+        await session.execute(text("""
+            INSERT INTO departments (name) SELECT :prefix || '-' || g FROM generate_series(1, :count) AS g
+        """), {"prefix": prefix, "count": departments})
+        doc_type = DocType(name=prefix)
+        session.add(doc_type)
+        await session.flush()
+        department_ids = list((await session.execute(
+            select(Department.id).where(Department.name.like(f"{prefix}-%")).order_by(Department.id)
+        )).scalars())
+
+        await session.execute(text("""
+            INSERT INTO users (username, password, name, department_id, create_at, admin)
+            SELECT :prefix || '-' || g, '!', :prefix || ' ' || g, (CAST(:department_ids AS integer[]))[1 + g % :departments], now(), false
+            FROM generate_series(1, :count) AS g
+        """), {"prefix": prefix, "department_ids": department_ids, "departments": departments, "count": users})
+        user_id = await session.scalar(select(User.id).where(User.username == f"{prefix}-1"))
+        await session.execute(
+            text("UPDATE users SET password = :password WHERE id = :id"),
+            {"password": get_password_hash(password), "id": user_id},
+        )
+        # Каждый пятый пользователь — ответственный за свою службу
+        await session.execute(text("""
+            INSERT INTO responsibles (user_id, department_id, created_at)
+            SELECT id, department_id, now() FROM users WHERE username LIKE :prefix || '-%' AND (id % 5 = 0 OR id = :user_id)
+        """), {"prefix": prefix, "user_id": user_id})
+        user_ids = (await session.execute(
+            text("SELECT min(id), max(id) FROM users WHERE username LIKE :prefix || '-%'"), {"prefix": prefix}
+        )).one()
+
+        await session.execute(text("""
+            INSERT INTO documents (filename, original_filename, file_number, file_path, doc_type_id, responsible_id,
+                                   uploaded_by, uploaded_at, valid_until, permanent)
+            SELECT 'plans-' || g, 'Документ ' || g || '.pdf', 'N-' || g, 'plans', :doc_type_id,
+                   (CAST(:department_ids AS integer[]))[1 + g % :departments], :first_user + g % :users,
+                   now() - (g % 365) * interval '1 day' - (g % 86400) * interval '1 second',
+                   CASE WHEN g % 4 = 0 THEN NULL ELSE (now() + (g % 700 - 350) * interval '1 day')::date END,
+                   g % 4 = 0
+            FROM generate_series(1, :count) AS g
+        """), {"doc_type_id": doc_type.id, "department_ids": department_ids, "departments": departments,
+               "first_user": user_ids[0], "users": users, "count": documents})
+        document_ids = (await session.execute(
+            text("SELECT min(id), max(id) FROM documents WHERE doc_type_id = :doc_type_id"),
+            {"doc_type_id": doc_type.id}
+        )).one()
+        # Читателей документа видит только загрузивший его
+        own_file_id = await session.scalar(
+            text("SELECT max(id) FROM documents WHERE doc_type_id = :doc_type_id AND uploaded_by = :user_id"),
+            {"doc_type_id": doc_type.id, "user_id": user_id}
+        )
+
+        # Уведомления приходятся на последние months месяцев: секции для них создаются заранее
+        await session.execute(text("""
+            SELECT notifications_create_partitions((date_trunc('month', now()) - :months * interval '1 month')::date,
+                                                   date_trunc('month', now())::date)
+        """), {"months": months})
+        await session.execute(text("""
+            INSERT INTO notifications (file_id, user_id, message, created_at, is_read)
+            SELECT :first_document + g % :documents, :first_user + (g * 7) % :users, 'Вам назначен новый файл',
+                   now() - (g % (:months * 30)) * interval '1 day' - (g % 86400) * interval '1 second', g % 3 <> 0
+            FROM generate_series(1, :count) AS g
+        """), {"first_document": document_ids[0], "documents": documents, "first_user": user_ids[0],
+               "users": users, "months": months, "count": notifications})
+        await session.commit()
+
+    async with engine.connect() as connection:
+        for table in ("departments", "users", "responsibles", "documents", "notifications", "notification_inbox"):
+            await connection.execute(text(f"ANALYZE {table}"))
+        await connection.commit()
+
+    return {
+        "prefix": prefix,
+        "username": f"{prefix}-1",
+        "password": password,
+        "user_id": user_id,
+        "department_id": department_ids[0],
+        "doc_type_id": doc_type.id,
+        "file_id": own_file_id,
+    }
+
+
+async def _cleanup(prefix: str) -> None:
+    async with session_factory() as session:
+        # Документы, ответственные и уведомления удаляются каскадом вместе с пользователями и службами
+        await session.execute(delete(User).where(User.username.like(f"{prefix}-%")))
+        await session.execute(delete(Department).where(Department.name.like(f"{prefix}-%")))
+        await session.execute(delete(DocType).where(DocType.name == prefix))
+        await session.commit()
+
+
+def _plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _plan_nodes(child)
+
+
+async def _seq_scans(plan: dict) -> list[str]:
+    relations = []
+    for node in _plan_nodes(plan["Plan"]):
+        relation = node.get("Relation Name")
+        if node["Node Type"] == "Seq Scan" and relation is not None:
+            # Секции notifications_pГГГГ_ММ и notifications_default относятся к notifications
+            table = "notifications" if relation.startswith("notifications_") else relation
+            if table in LARGE_TABLES:
+                relations.append(relation)
+    if not relations:
+        return []
+    async with engine.connect() as connection:
+        result = await connection.execute(
+            text("SELECT relname FROM pg_class WHERE relname = ANY(:names) AND reltuples >= :min_rows"),
+            {"names": relations, "min_rows": SEQ_SCAN_MIN_ROWS}
+        )
+        large = set(result.scalars())
+    return [relation for relation in relations if relation in large]
+
+
+async def _explain(statement: str, parameters) -> dict:
+    async with engine.connect() as connection:
+        raw = await connection.get_raw_connection()
+        plan = await raw.driver_connection.fetchval(f"EXPLAIN (FORMAT JSON) {statement}", *(parameters or ()))
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+async def check_endpoints(values: dict) -> list[dict]:
+    """
+    Вызывает эндпоинты CHECKS от имени пользователя из _seed и проверяет планы их запросов.
+    Возвращает по записи на проверку: label, statements, cost, budget, problems (пусто — проверка прошла).
+    """
+    captured: list[tuple[str, tuple]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            captured.append((statement, parameters))
+
+    engines = [engine] + ([replica_engine] if replica_engine is not None else [])
+    for target in engines:
+        event.listen(target.sync_engine, "before_cursor_execute", capture)
+
+    results = []
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://plans") as client:
+            response = await client.post("/api/auth/signin",
+                                         json={"username": values["username"], "password": values["password"]})
+            response.raise_for_status()
+            first_page = (await client.get("/api/file/all")).json()
+            values = {**values, "cursor": first_page["next_cursor"]}
+
+            for path, params, budget in CHECKS:
+                url = path.format(**values)
+                query = {key: value.format(**values) for key, value in params.items()}
+                captured.clear()
+                response = await client.get(url, params=query)
+                label = url + ("?" + "&".join(f"{k}={v}" for k, v in params.items()) if params else "")
+                result = {"label": label, "statements": 0, "cost": None, "budget": budget, "problems": []}
+                results.append(result)
+                if response.status_code >= 400:
+                    result["problems"].append(f"HTTP {response.status_code}")
+                    continue
+
+                statements = [(s, p) for s, p in captured if FROM_RE.search(s)]
+                result["statements"], result["cost"] = len(statements), 0.0
+                for statement, parameters in statements:
+                    plan = await _explain(statement, parameters)
+                    cost = plan["Plan"]["Total Cost"]
+                    result["cost"] = max(result["cost"], cost)
+                    if cost > budget:
+                        result["problems"].append(f"стоимость {cost:.0f}: {' '.join(statement[:120].split())}")
+                    for relation in await _seq_scans(plan):
+                        result["problems"].append(f"Seq Scan {relation}: {' '.join(statement[:120].split())}")
+    finally:
+        for target in engines:
+            event.remove(target.sync_engine, "before_cursor_execute", capture)
+    return results
+
+
+async def run(args) -> bool:
+    values = await _seed(args.users, args.departments, args.documents, args.notifications, args.months)
+    try:
+        results = await check_endpoints(values)
+    finally:
+        if not args.keep:
+            await _cleanup(values["prefix"])
+
+    print(f"{'эндпоинт':<60} {'запросов':>8} {'стоимость':>10} {'бюджет':>8}  результат")
+    for result in results:
+        cost = "" if result["cost"] is None else f"{result['cost']:.0f}"
+        print(f"{result['label']:<60} {result['statements']:>8} {cost:>10} {result['budget']:>8}  "
+              f"{'ok' if not result['problems'] else 'FAIL'}")
+        for problem in result["problems"]:
+            print(f"    {problem}")
+    return all(not result["problems"] for result in results)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Проверка планов запросов горячих эндпоинтов")
+    parser.add_argument("--users", type=int, default=60000, help="каждый пятый становится ответственным")
+    parser.add_argument("--departments", type=int, default=40)
+    parser.add_argument("--documents", type=int, default=200000)
+    parser.add_argument("--notifications", type=int, default=1000000)
+    parser.add_argument("--months", type=int, default=6, help="за сколько месяцев распределить уведомления")
+    parser.add_argument("--keep", action="store_true", help="не удалять синтетические данные")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
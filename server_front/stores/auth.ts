@@ -69,8 +69,9 @@ export const useAuthStore = defineStore('auth', {
         clearUser() {
             this.user = null
             this.isAuthLoaded = false
-            // Также очищаем интервалы при очистке пользователя
+            // Также очищаем интервалы и закрываем канал уведомлений при очистке пользователя
             this.clearNotificationIntervals()
+            useNotificationStore().disconnect()
         },
         addNotificationInterval(intervalId: NodeJS.Timeout) {
             this.notificationIntervals.push(intervalId)
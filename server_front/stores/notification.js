@@ -1,14 +1,19 @@
 import {defineStore} from 'pinia'
 
+// Соединение и таймер переподключения не хранятся в state: они не сериализуемы
+let socket = null
+let reconnectTimer = null
+let reconnectDelay = 1000
+const MAX_RECONNECT_DELAY = 30000
+
 export const useNotificationStore = defineStore('notification', {
     state: () => ({
-        notifications: []
+        notifications: [],
+        unread: 0
     }),
 
     getters: {
-        unreadCount: (state) => {
-            return state.notifications.filter(n => !n.is_read).length
-        }
+        unreadCount: (state) => state.unread
     },
 
     actions: {
@@ -29,7 +34,7 @@ export const useNotificationStore = defineStore('notification', {
             } catch (err) {
                 // Если получили 401, очищаем уведомления и не выводим ошибку в консоль
                 if (err.status === 401 || err.statusCode === 401) {
-                    this.notifications = []
+                    this.clearNotifications()
                     // Очищаем состояние пользователя в auth store
                     authStore.clearUser()
                     
@@ -43,8 +48,78 @@ export const useNotificationStore = defineStore('notification', {
             }
         },
 
+        // Подписка на события уведомлений. После каждого (пере)подключения список перечитывается целиком,
+        // дальше изменения приходят через сокет без периодических запросов
+        connect() {
+            const authStore = useAuthStore()
+            if (!process.client || !authStore.user || socket) return
+
+            const config = useRuntimeConfig()
+            const url = `${config.public.apiBase.replace(/^http/, 'ws')}/api/notification/ws`
+            socket = new WebSocket(url)
+
+            socket.onopen = () => {
+                reconnectDelay = 1000
+                this.fetchNotifications()
+                this.fetchCount()
+            }
+
+            socket.onmessage = (message) => {
+                const event = JSON.parse(message.data)
+                if (event.type === 'notification') {
+                    if (!this.notifications.some(n => n.id === event.notification.id)) {
+                        this.notifications.unshift(event.notification)
+                    }
+                } else if (event.type === 'read') {
+                    this.notifications = this.notifications.filter(n => !event.ids.includes(n.id))
+                } else if (event.type === 'resync') {
+                    this.fetchNotifications()
+                }
+                this.fetchCount()
+            }
+
+            socket.onclose = () => {
+                socket = null
+                if (!authStore.user) return
+                reconnectTimer = setTimeout(() => {
+                    reconnectTimer = null
+                    this.connect()
+                }, reconnectDelay)
+                reconnectDelay = Math.min(reconnectDelay * 2, MAX_RECONNECT_DELAY)
+            }
+        },
+
+        disconnect() {
+            if (reconnectTimer) {
+                clearTimeout(reconnectTimer)
+                reconnectTimer = null
+            }
+            if (socket) {
+                socket.onclose = null
+                socket.close()
+                socket = null
+            }
+        },
+
+        // Счётчик для значка: ответ из пары байт, при неизменном значении браузер получает 304 по ETag
+        async fetchCount() {
+            const authStore = useAuthStore()
+            if (!authStore.user) return
+            const config = useRuntimeConfig()
+            try {
+                const data = await $fetch(`${config.public.apiBase}/api/notification/count`, {
+                    credentials: 'include'
+                })
+                this.unread = data.unread
+            } catch (err) {
+                console.error('Ошибка при загрузке счётчика уведомлений:', err)
+            }
+        },
+
         clearNotifications() {
+            this.disconnect()
             this.notifications = []
+            this.unread = 0
         }
     }
 })